@@ -0,0 +1,199 @@
+"""
+benchmark lsbeer end to end (bar search, menu, beer lookups) against the local stand-in (see standin.py),
+at several menu sizes & concurrency settings -> throughput, time to results (ttr50 / ttr99) & peak RSS
+
+    python bench/bench_e2e.py [--sizes 10 50 500] [--configs serial:1 async:4 async:16 pool:4]
+    python bench/bench_e2e.py --bar "some bar"        # recorded bar (fixtures/http), cut to each size
+    python bench/bench_e2e.py --target main           # via outer_main (wall time only)
+    python bench/bench_e2e.py --out new.json --baseline old.json # fail if slower than last time
+
+each run is its own process w a cold cache, so runs don't share memory, sockets or cache
+"""
+import argparse
+from contextlib import redirect_stderr, redirect_stdout
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standin import FIXTURES_DIR, JITTER, LATENCY, PAD, StandIn
+
+
+SIZES = (10, 50, 500)
+CONFIGS = ('serial:1', 'async:4', 'async:16', 'pool:4') # engine:nthreads
+
+UNLIMITED = '1000:1000:1000' # requests / s (burst, max), i.e. measure lsbeer rather than politeness
+
+TOLERANCE = 0.1 # throughput drop vs baseline that counts as a regression
+
+
+def peak_rss():
+    # ru_maxrss is KB on linux (bytes on mac)
+    scale = 1024**2 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(who).ru_maxrss
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / scale
+
+
+def run_one(d_config):
+    """
+    config -> results dict (in this process, so env must already point at stand-in & a fresh cache)
+
+    ttr50 / ttr99: s from run start (incl bar & menu) until half / 99% of beers' results were in,
+                   i.e. how long a user waits, rather than any one beer's own lookup time
+    """
+    from get_beer import get_bar_cached, get_beers_cached, iter_beer_dict, outer_main
+    from profiling import quantile
+    import ratelimit
+
+    engine, nthreads = d_config['engine'], d_config['nthreads']
+    if engine == 'pool':
+        ratelimit.configure(share=nthreads)
+
+    t = time.perf_counter()
+
+    if d_config['target'] == 'main':
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+            outer_main(barquery=d_config['bar'], nthreads=nthreads, engine=engine,
+                       get_cans=True) # i.e. whole menu
+        wall = time.perf_counter() - t
+
+        _, bar_url = get_bar_cached(d_config['bar']) # (cached by now)
+        n, ttrs = len(get_beers_cached(bar_url)), []
+
+    else:
+        _, bar_url = get_bar_cached(d_config['bar'])
+        beerlst = list(get_beers_cached(bar_url))[:d_config['size']]
+
+        ttrs = sorted(time.perf_counter() - t for _ in iter_beer_dict( # (in order of completion)
+            beerlst, nthreads=nthreads, engine=engine, progress=False))
+        n = len(beerlst)
+
+        wall = time.perf_counter() - t
+
+    return dict(d_config,
+                beers=n,
+                wall=wall,
+                throughput=n / wall,
+                ttr50=quantile(ttrs, 0.5) if ttrs else None,
+                ttr99=quantile(ttrs, 0.99) if ttrs else None,
+                peak_mb=peak_rss())
+
+
+def run_isolated(d_config, standin_url, real_rates=False):
+    """
+    config -> results dict, from fresh subprocess w cold cache
+    """
+    from ratelimit import D_LIMITS
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ,
+                   LSBEER_STANDIN=standin_url,
+                   LSBEER_CACHE_DIR=cache_dir)
+        env.pop('LSBEER_RECORD', None)
+        if not real_rates:
+            env['LSBEER_RATES'] = ','.join('{}={}'.format(domain, UNLIMITED)
+                                           for domain in D_LIMITS.keys())
+
+        out = subprocess.run([sys.executable, os.path.abspath(__file__),
+                              '--one', json.dumps(d_config)],
+                             env=env, stdout=subprocess.PIPE, check=True).stdout
+
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    results, baseline results -> lst of regressions (str)
+    """
+    key = lambda d: (d['target'], d['bar'], d['size'], d['engine'], d['nthreads'])
+    d_baseline = {key(d): d for d in baseline}
+
+    regressions = []
+    for d in results:
+        old = d_baseline.get(key(d))
+        if old and d['throughput'] < (1 - tolerance) * old['throughput']:
+            regressions.append('{} @ {} beers, {}:{}: {:.1f} -> {:.1f} beers/s'.format(
+                d['target'], d['size'], d['engine'], d['nthreads'],
+                old['throughput'], d['throughput']))
+    return regressions
+
+
+def benchmark(sizes=SIZES, configs=CONFIGS, bar=None, target='populate',
+              fixtures_dir=FIXTURES_DIR, latency=LATENCY, jitter=JITTER, pad=PAD,
+              real_rates=False):
+    fmt = '{:>6}{:>8}{:>9}{:>10}{:>10}{:>9}{:>9}{:>10}'
+    print(fmt.format('beers', 'engine', 'threads', 'wall s', 'beers/s', 'ttr50 s', 'ttr99 s',
+                     'peak MB'))
+
+    results = []
+    with StandIn(fixtures_dir, latency=latency, jitter=jitter, pad=pad) as standin:
+        for size in sizes:
+            for config in configs:
+                engine, nthreads = config.split(':')
+                d_config = dict(target=target, bar=(bar or 'synthetic {}'.format(size)),
+                                size=size, engine=engine, nthreads=int(nthreads))
+
+                d = run_isolated(d_config, standin.url, real_rates=real_rates)
+                results.append(d)
+
+                print(fmt.format(d['beers'], engine, nthreads,
+                                 *('{:.2f}'.format(d[k]) if d[k] is not None else '-'
+                                   for k in ('wall', 'throughput', 'ttr50', 'ttr99')),
+                                 '{:.0f}'.format(d['peak_mb'])))
+
+        print('\nstand-in responses: {}'.format(' · '.join('{} {}'.format(k, v) for k, v
+                                                           in standin.hits.items())))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='end-to-end lsbeer benchmark, offline')
+    parser.add_argument('--sizes', nargs='*', type=int, default=list(SIZES),
+                        help='beers per menu (default: {})'.format(' '.join(map(str, SIZES))))
+    parser.add_argument('--configs', nargs='*', default=list(CONFIGS),
+                        help='engine:nthreads (default: {})'.format(' '.join(CONFIGS)))
+    parser.add_argument('--bar', help='recorded bar query (default: synthetic bar per size)')
+    parser.add_argument('--target', choices=('populate', 'main'), default='populate',
+                        help='populate (menu + lookups, time to results) or main (outer_main, wall only)')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help='recorded fixtures dir (default: bench/fixtures/http)')
+    parser.add_argument('--latency', type=float, default=1000 * LATENCY,
+                        help='ms per response (default: {:.0f})'.format(1000 * LATENCY))
+    parser.add_argument('--jitter', type=float, default=1000 * JITTER,
+                        help='+/- ms per response (default: {:.0f})'.format(1000 * JITTER))
+    parser.add_argument('--pad', type=int, default=PAD,
+                        help='KB filler per synthetic beerpage (default: {})'.format(PAD))
+    parser.add_argument('--real-rates', action='store_true',
+                        help='keep per-site rate limits (default: off, to measure lsbeer itself)')
+    parser.add_argument('--out', help='save results json')
+    parser.add_argument('--baseline', help='results json to compare against (exit 1 on regression)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='throughput drop counted as regression (default: {})'.format(TOLERANCE))
+    parser.add_argument('--one', help=argparse.SUPPRESS) # (internal) single isolated run
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_one(json.loads(args.one))))
+        sys.exit(0)
+
+    results = benchmark(sizes=args.sizes, configs=args.configs, bar=args.bar,
+                        target=args.target, fixtures_dir=args.fixtures,
+                        latency=args.latency / 1000, jitter=args.jitter / 1000,
+                        pad=args.pad, real_rates=args.real_rates)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), tolerance=args.tolerance)
+
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        sys.exit(1 if regressions else 0)
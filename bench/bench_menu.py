@@ -0,0 +1,113 @@
+"""
+benchmark bar menu fetch: plain http vs headless browser, over saved bar page fixtures (served locally)
+
+    python bench/bench_menu.py --record https://www.beermenus.com/places/...
+    python bench/bench_menu.py [-n 3]
+"""
+import argparse
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapers import get_beers
+from sessions import fetch
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures', 'beermenus')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def record(urls):
+    """
+    bar urls -> saved to fixtures/beermenus/
+    """
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    for url in urls:
+        path = os.path.join(FIXTURES_DIR, '{}.html'.format(
+            urlparse(url).path.strip('/').replace('/', '_')))
+        with open(path, 'w') as f:
+            f.write(fetch(url).text)
+
+        print('saved {}'.format(path))
+
+
+def measure(fn, n=3):
+    """
+    fn -> (mean s, peak python MB, peak child MB, result)
+    """
+    tracemalloc.start()
+    t = time.perf_counter()
+
+    for _ in range(n):
+        result = fn()
+
+    t = (time.perf_counter() - t) / n
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is KB on linux (bytes on mac)
+    peak_child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    return t, peak / 1024**2, peak_child, result
+
+
+def benchmark(n=3):
+    try:
+        fixtures = sorted(f for f in os.listdir(FIXTURES_DIR) if f.endswith('.html'))
+    except(FileNotFoundError):
+        fixtures = []
+
+    if not fixtures:
+        print('no fixtures - see --record')
+        return
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 partial(QuietHandler, directory=FIXTURES_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    print('{:<40}{:>9}{:>8}{:>12}{:>22}'.format('fixture', 'path', 'beers',
+                                                 'time (s)', 'peak MB (py/child)'))
+    for fixture in fixtures:
+        url = 'http://{}:{}/{}'.format(host, port, fixture)
+
+        for label, from_headless in (('plain', False), ('headless', True)):
+            try:
+                t, peak, peak_child, d_stats = measure(
+                    partial(get_beers, url, from_headless=from_headless), n=n)
+            except(Exception) as e: # e.g. no headless browser here
+                print('{:<40}{:>9}  failed ({})'.format(fixture, label, e))
+                continue
+
+            print('{:<40}{:>9}{:>8}{:>12.3f}{:>15.1f} / {:.1f}'.format(
+                fixture[:39], label, len(d_stats), t, peak, peak_child))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='bar menu fetch benchmark')
+    parser.add_argument('--record', nargs='*', default=[],
+                        help='beermenus bar url/s to save as fixtures')
+    parser.add_argument('-n', type=int, default=3,
+                        help='fetches per path (default: 3)')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+    else:
+        benchmark(n=args.n)
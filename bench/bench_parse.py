@@ -0,0 +1,95 @@
+"""
+benchmark beerpage parsing: full soup vs partial (strained) soup, over saved page fixtures
+
+    python bench/bench_parse.py --record https://untappd.com/b/... https://www.beeradvocate.com/beer/profile/...
+    python bench/bench_parse.py [-n 20]
+"""
+import argparse
+import os
+import sys
+import timeit
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from scrapers import (parse_beeradvocate, parse_untappd,
+                      BEERADVOCATE_STRAINER, UNTAPPD_STRAINER)
+from sessions import PARSER, fetch
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+D_PARSERS = dict(
+    untappd = (parse_untappd, SoupStrainer(**UNTAPPD_STRAINER)),
+    beeradvocate = (parse_beeradvocate, SoupStrainer(**BEERADVOCATE_STRAINER))
+)
+
+
+def url2site(url):
+    return next(site for site in D_PARSERS.keys() if site in urlparse(url).netloc)
+
+
+def record(urls):
+    """
+    beerpage urls -> saved to fixtures/{site}/
+    """
+    for url in urls:
+        site = url2site(url)
+        dirname = os.path.join(FIXTURES_DIR, site)
+        os.makedirs(dirname, exist_ok=True)
+
+        path = os.path.join(dirname, '{}.html'.format(
+            urlparse(url).path.strip('/').replace('/', '_')))
+        with open(path, 'w') as f:
+            f.write(fetch(url).text)
+
+        print('saved {}'.format(path))
+
+
+def benchmark(n=20):
+    print('{:<14}{:>6}{:>12}{:>14}{:>10}'.format('site', 'pages', 'full (ms)',
+                                                 'partial (ms)', 'speedup'))
+    for site, (parse, strainer) in D_PARSERS.items():
+        dirname = os.path.join(FIXTURES_DIR, site)
+        try:
+            paths = sorted(os.path.join(dirname, f) for f in os.listdir(dirname)
+                           if f.endswith('.html'))
+        except(FileNotFoundError):
+            paths = []
+
+        if not paths:
+            print('{:<14}{:>6}  (no fixtures - see --record)'.format(site, 0))
+            continue
+
+        t_full = t_partial = 0
+        for path in paths:
+            with open(path) as f:
+                html = f.read()
+
+            full = lambda: parse(BeautifulSoup(html, PARSER))
+            partial = lambda: parse(BeautifulSoup(html, PARSER, parse_only=strainer))
+
+            assert full() == partial(), 'partial parse differs for {}'.format(path)
+
+            t_full += timeit.timeit(full, number=n) / n
+            t_partial += timeit.timeit(partial, number=n) / n
+
+        print('{:<14}{:>6}{:>12.2f}{:>14.2f}{:>9.1f}x'.format(
+            site, len(paths), 1000 * t_full / len(paths),
+            1000 * t_partial / len(paths), t_full / t_partial))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='beerpage parsing benchmark')
+    parser.add_argument('--record', nargs='*', default=[],
+                        help='beerpage url/s to save as fixtures')
+    parser.add_argument('-n', type=int, default=20,
+                        help='parses per page (default: 20)')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+    else:
+        benchmark(n=args.n)
@@ -0,0 +1,136 @@
+"""
+benchmark lsbeer startup: which modules `get_beer.py` imports before doing anything (& how long that takes),
+and how soon after launch its first request reaches the local stand-in (see standin.py)
+
+    python bench/bench_startup.py                                       # exit 1 on regression
+    python bench/bench_startup.py --budget-import 30 --budget-first 200 # ms
+
+i.e. heavy deps (requests, bs4, lxml, tqdm, CLIppy, ..) must load on first use, not at startup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from standin import FIXTURES_DIR, StandIn
+
+
+GET_BEER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'get_beer.py')
+
+HEAVY = ('requests', 'httpx', 'urllib3', 'bs4', 'lxml', 'tqdm', 'CLIppy', 'scrapers', 'sessions',
+         'engine', 'asyncio', 'multiprocessing', 'IPython', 'numpy', 'pyarrow')
+
+BUDGET_IMPORT = 40 # ms, lsbeer's own imports (beyond bare interpreter) for `-h`
+BUDGET_FIRST = 250 # ms, launch -> first request, beyond bare interpreter (mostly requests & CLIppy)
+REPEATS = 7
+
+
+def import_times(args):
+    """
+    args (to python) -> {module: self time in us}, via -X importtime
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            check=True).stderr.decode('utf-8')
+
+    d_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, module = line[len('import time:'):].split('|')
+        d_times[module.strip()] = int(self_us)
+    return d_times
+
+
+def startup_imports():
+    """
+    -> {module: self time in us} imported by `get_beer.py -h`, beyond those of a bare interpreter
+    """
+    d_bare = import_times(['-c', 'pass'])
+    return {module: us for module, us in import_times([GET_BEER, '-h']).items()
+            if module not in d_bare}
+
+
+def wall(args, env=None):
+    """
+    args (to python) -> s from launch to exit
+    """
+    t = time.time()
+    subprocess.run([sys.executable] + args, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - t
+
+
+def time_to_first_request(standin, query='synthetic 5'):
+    """
+    stand-in, bar query -> s from launch to first request in (w cold cache)
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, LSBEER_STANDIN=standin.url, LSBEER_CACHE_DIR=cache_dir)
+        env.pop('LSBEER_RECORD', None)
+
+        standin.first_request = None
+        t = time.time()
+        subprocess.run([sys.executable, GET_BEER, query], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return standin.first_request - t
+
+
+def benchmark(budget_import=BUDGET_IMPORT, budget_first=BUDGET_FIRST, repeats=REPEATS,
+              fixtures_dir=FIXTURES_DIR):
+    """
+    -> lst of regressions (str)
+    """
+    regressions = []
+
+    d_imports = startup_imports()
+    heavy = sorted({module.split('.')[0] for module in d_imports} & set(HEAVY))
+    import_ms = sum(d_imports.values()) / 1000
+
+    print('startup imports: {} modules, {:.1f} ms'.format(len(d_imports), import_ms))
+    for module, us in sorted(d_imports.items(), key=lambda kv: kv[1], reverse=True)[:5]:
+        print('    {:<24}{:>8.1f} ms'.format(module, us / 1000))
+
+    if heavy:
+        regressions.append('imported at startup: {}'.format(', '.join(heavy)))
+    if import_ms > budget_import:
+        regressions.append('startup imports {:.1f} ms > {} ms'.format(import_ms, budget_import))
+
+    # best of n, since noise only ever adds
+    bare = min(wall(['-c', 'pass']) for _ in range(repeats))
+    with StandIn(fixtures_dir, latency=0, jitter=0) as standin:
+        first = min(time_to_first_request(standin) for _ in range(repeats))
+    first_ms = 1000 * (first - bare)
+
+    print('\nbare interpreter: {:.0f} ms'.format(1000 * bare))
+    print('launch -> first request: {:.0f} ms (+{:.0f} ms)'.format(1000 * first, first_ms))
+
+    if first_ms > budget_first:
+        regressions.append('first request +{:.0f} ms > {} ms'.format(first_ms, budget_first))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='lsbeer startup benchmark, offline')
+    parser.add_argument('--budget-import', type=float, default=BUDGET_IMPORT,
+                        help='ms for startup imports, beyond bare interpreter (default: {})'.format(BUDGET_IMPORT))
+    parser.add_argument('--budget-first', type=float, default=BUDGET_FIRST,
+                        help='ms from launch to first request, beyond bare interpreter (default: {})'.format(BUDGET_FIRST))
+    parser.add_argument('--repeats', type=int, default=REPEATS,
+                        help='runs, of which best counts (default: {})'.format(REPEATS))
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help='recorded fixtures dir (default: bench/fixtures/http)')
+    args = parser.parse_args()
+
+    regressions = benchmark(budget_import=args.budget_import, budget_first=args.budget_first,
+                            repeats=args.repeats, fixtures_dir=args.fixtures)
+
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,185 @@
+"""
+check lsbeer backs off when sites push back: token bucket (w fake clock), Retry-After & backoff parsing, then
+fetches against the local stand-in answering every request 429 + Retry-After (see standin.py)
+
+    python bench/check_ratelimit.py # exit 1 on failure
+
+i.e. throttled responses must reach the rate limiter (halving the bucket & pausing it), not be retried
+out of its sight (e.g. by urllib3), & once out of retries must leave sites pending, not cached as not found
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CACHE_DIR = tempfile.mkdtemp(prefix='lsbeer-check-')
+os.environ['LSBEER_CACHE_DIR'] = CACHE_DIR # scratch cache (set before cache.py reads it)
+
+from standin import StandIn
+
+import profiling
+import ratelimit
+import sessions
+
+
+HOST = 'untappd.com'
+RATE = 4 # requests / s
+RETRIES = 2
+RETRY_AFTER = 1 # s
+
+
+class FakeClock(object):
+    """
+    clock that only moves when slept on
+    """
+
+    def __init__(self):
+        self.now = 0.
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+def check_bucket():
+    """
+    -> lst of failures (str)
+    """
+    failures = []
+
+    clock = FakeClock()
+    bucket = ratelimit.TokenBucket(RATE, burst=1, max_rate=(2 * RATE), clock=clock,
+                                   sleep=clock.sleep)
+
+    if bucket.acquire() != 0:
+        failures.append('bucket: first request waited')
+
+    bucket.on_throttle(retry_after=2)
+    if bucket.rate != RATE * ratelimit.DECREASE:
+        failures.append('bucket: rate {} after throttle, not {}'.format(
+            bucket.rate, RATE * ratelimit.DECREASE))
+    if bucket.paused_until != clock() + 2:
+        failures.append('bucket: not paused for Retry-After')
+    if bucket.acquire() < 2:
+        failures.append('bucket: request went ahead during pause')
+
+    rate = bucket.rate
+    bucket.on_success()
+    if not rate < bucket.rate <= 2 * RATE:
+        failures.append('bucket: rate didn\'t creep up on success')
+
+    return failures
+
+
+def check_parsing():
+    failures = []
+
+    if ratelimit.parse_retry_after('3') != 3:
+        failures.append('Retry-After: "3" -> {}'.format(ratelimit.parse_retry_after('3')))
+
+    s = ratelimit.parse_retry_after(formatdate(time.time() + 10, usegmt=True))
+    if s is None or not 8 <= s <= 10:
+        failures.append('Retry-After: http date 10 s out -> {}'.format(s))
+
+    if ratelimit.parse_retry_after('soon') is not None:
+        failures.append('Retry-After: garbage not ignored')
+
+    if ratelimit.backoff(0, retry_after=1000) != ratelimit.MAX_BACKOFF:
+        failures.append('backoff: Retry-After not capped')
+    if not all(0.5 * ratelimit.BACKOFF * 2**i <= ratelimit.backoff(i) <= 1.5 * ratelimit.BACKOFF * 2**i
+               for i in range(4)):
+        failures.append('backoff: not jittered exponential')
+
+    return failures
+
+
+def check_fetch():
+    """
+    -> lst of failures, from fetching via stand-in that throttles everything
+    """
+    from requests import HTTPError
+
+    failures = []
+
+    with StandIn(latency=0, jitter=0, throttle=1, retry_after=RETRY_AFTER) as standin:
+        os.environ[sessions.ENV_STANDIN] = standin.url
+        sessions.configure(retries=RETRIES)
+        ratelimit.configure(rates='{}={}:{}:{}'.format(HOST, RATE, RATE, RATE))
+        profiling.enable()
+
+        try:
+            response = sessions.fetch('https://{}/b/some-beer/1'.format(HOST))
+            failures.append('fetch: {} returned, rather than raised'.format(response.status_code))
+        except(HTTPError) as e:
+            if e.response is None or e.response.status_code != 429:
+                failures.append('fetch: raised {!r}, not for 429'.format(e))
+
+    bucket = ratelimit.get_limiter().bucket(HOST)
+    d_counts = profiling.get_stats()['counts']
+
+    if standin.hits['throttled'] != RETRIES + 1:
+        failures.append('fetch: {} requests sent, not {} (retried out of limiter\'s sight?)'.format(
+            standin.hits['throttled'], RETRIES + 1))
+    if d_counts.get('throttled:' + HOST) != RETRIES + 1:
+        failures.append('fetch: throttled:{} = {}, not {}'.format(
+            HOST, d_counts.get('throttled:' + HOST), RETRIES + 1))
+    if d_counts.get('retry:' + HOST) != RETRIES:
+        failures.append('fetch: retry:{} = {}, not {}'.format(HOST, d_counts.get('retry:' + HOST),
+                                                             RETRIES))
+    if bucket.rate != RATE * ratelimit.DECREASE**(RETRIES + 1):
+        failures.append('fetch: bucket rate {}, not halved per throttle'.format(bucket.rate))
+    if not bucket.paused_until:
+        failures.append('fetch: bucket never paused for Retry-After')
+
+    return failures
+
+
+def check_populate(beer='Throttled Beer'):
+    """
+    -> lst of failures, from looking up beer via stand-in that throttles everything (i.e. out of retries)
+    """
+    from cache import get_cache
+    from get_beer import BEERPAGES, populate_beer_dict
+    from names import canonicalize
+    from sites import SITES
+
+    failures = []
+
+    with StandIn(latency=0, jitter=0, throttle=1, retry_after=0) as standin:
+        os.environ[sessions.ENV_STANDIN] = standin.url
+        sessions.configure(retries=0)
+        ratelimit.configure(rates=','.join('{}=1000:1000:1000'.format(host) for host in (
+            HOST, 'ratebeer.com', 'beeradvocate.com', 'google.com')))
+
+        d_stats = populate_beer_dict([beer], progress=False)[beer]
+
+    not_pending = [site for site in SITES if not d_stats[site].get('pending')]
+    if not_pending:
+        failures.append('populate: {} not pending'.format(', '.join(not_pending)))
+
+    cached = [site for site in SITES + (BEERPAGES,)
+              if get_cache().get(canonicalize(beer), site) is not None]
+    if cached:
+        failures.append('populate: {} cached (as not found?)'.format(', '.join(cached)))
+
+    return failures
+
+
+if __name__ == '__main__':
+    try:
+        failures = check_bucket() + check_parsing() + check_fetch() + check_populate()
+    finally:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    for failure in failures:
+        print('FAIL {}'.format(failure))
+    print('{} failures'.format(len(failures)))
+    sys.exit(1 if failures else 0)
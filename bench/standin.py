@@ -0,0 +1,293 @@
+"""
+local stand-in for beermenus / untappd / ratebeer / beeradvocate / google: serves recorded fixtures
+(w simulated latency), else synthetic pages, so benchmarks are reproducible & offline
+
+record real responses (any lsbeer run, w LSBEER_RECORD set):
+
+    LSBEER_RECORD=bench/fixtures/http python get_beer.py "some bar"
+
+serve them (lsbeer then sends every request here, rather than to the real sites):
+
+    python bench/standin.py [--latency 80 --jitter 40] &
+    LSBEER_STANDIN=http://127.0.0.1:8799 python get_beer.py "some bar"
+    LSBEER_STANDIN=http://127.0.0.1:8799 python get_beer.py "synthetic 50" # made-up 50-beer bar
+
+    python bench/standin.py --throttle 0.2 --retry-after 1 & # 1 in 5 requests 429s (e.g. to watch backoff)
+"""
+import argparse
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions import fixture_path
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures', 'http')
+
+PORT = 8799
+LATENCY = 0.08 # s, per response..
+JITTER = 0.04  # s, .. +/- uniformly
+PAD = 50       # KB of filler per synthetic beerpage (real ones are heavy)
+RETRY_AFTER = 1 # s, told to throttled requests
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ru', 'ten', 'vor', 'sa', 'bel', 'dun', 'gri',
+             'ho', 'pel', 'zan', 'tu', 'fen', 'mar', 'quo', 'wil', 'ex', 'yar')
+STYLES = ('IPA - American', 'IPA - New England', 'Pilsner - German', 'Stout - Imperial',
+          'Sour - Gose', 'Lager - Helles', 'Porter - Baltic', 'Saison / Farmhouse Ale')
+SERVINGS = ('Draft', 'Draft', 'Draft', 'Cask', 'Can', 'Bottle')
+
+
+def synthetic_beers(n):
+    """
+    n -> lst of n distinct made-up beernames (same every time)
+    """
+    rng = random.Random(n)
+    word = lambda: ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+
+    beers = {}
+    while len(beers) < n:
+        beers.setdefault('{} {} {}'.format(word(), word(), rng.choice(('Ale', 'IPA', 'Lager',
+                                                                       'Stout', 'Sour'))), None)
+    return list(beers)
+
+
+def stats(name):
+    """
+    beername -> (rating / 5, abv %, style), made up but stable
+    """
+    h = int(sha1(name.lower().encode('utf-8')).hexdigest(), 16)
+    return 3 + (h % 150) / 100, 4 + (h // 150 % 80) / 10, STYLES[h // 12000 % len(STYLES)]
+
+
+def slug(name):
+    return re.sub('[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def unslug(s):
+    return s.replace('-', ' ')
+
+
+def filler(kb):
+    return '<div class="filler">{}</div>'.format(
+        '<p class="x">lorem ipsum dolor sit amet, consectetur adipiscing elit</p>' * (kb * 14))
+
+
+def synthesize(method, url, body=None, pad=PAD):
+    """
+    request -> (status, content type, text) of made-up page in each site's markup (or None)
+    """
+    parsed = urlparse(url)
+    host, path = parsed.hostname, parsed.path
+    q = parse_qs(parsed.query).get('q', [''])[0]
+
+    html = lambda *parts: (200, 'text/html; charset=utf-8', '<html><body>{}</body></html>'.format(''.join(parts)))
+
+    if host.endswith('google.com'): # search -> beerpage links
+        id_ = int(sha1(q.lower().encode('utf-8')).hexdigest(), 16) % 10**6
+        return html(*('<a href="/url?q={}&sa=U">{}</a>'.format(quote(u, safe=':/'), q) for u in (
+            'https://untappd.com/b/{}/{}'.format(slug(q), id_),
+            'https://www.ratebeer.com/beer/{}/{}/'.format(slug(q), id_),
+            'https://www.beeradvocate.com/beer/profile/{}/{}/'.format(slug(q), id_))))
+
+    if host.endswith('untappd.com'):
+        if path.startswith('/search'):
+            return html('<p class="name"><a href="/b/{}/1">{}</a></p>'.format(slug(q), q))
+
+        name = unslug(path.split('/')[2])
+        rating, abv, style = stats(name)
+        return html('<div class="name"><h1>{}</h1><p class="style">{}</p></div>'.format(name, style),
+                    '<p class="abv">{:.1f}% ABV</p>'.format(abv),
+                    '<span class="num">({:.3f})</span>'.format(rating),
+                    '<div class="beer-descrption-read-less">a {} from nowhere Show Less</div>'.format(style.lower()),
+                    filler(pad))
+
+    if host.endswith('beeradvocate.com'):
+        if path.startswith('/search'):
+            return html('<a href="/beer/profile/{}/1/">{}</a>'.format(slug(q), q))
+
+        name = unslug(path.split('/')[3]) # /beer/profile/{slug}/{id}/
+        rating, abv, style = stats(name)
+        return html('<span itemprop="title">Beers</span>',
+                    '<span class="ba-ravg">{:.2f}</span>'.format(rating),
+                    '<dd class="beerstats"><span title="Percentage of alcohol by volume.">{:.1f}%</span></dd>'.format(abv),
+                    '<dd class="beerstats"><a href="/beer/styles/1/">{}</a></dd>'.format(style),
+                    '<dd class="beerstats"><a href="/place/directory/9/US/NY/">New York, United States</a></dd>',
+                    filler(pad))
+
+    if host.endswith('ratebeer.com') and method == 'POST': # graphql, aliased or not
+        d_query = json.loads(body or '{}')
+        d_vars = d_query.get('variables', {})
+
+        def hits(name):
+            rating, abv, style = stats(name)
+            d_beer = {'averageRating': rating, 'abv': abv,
+                      'description': 'a {}'.format(style.lower())}
+            return {'items': [{'beer': {k: v for k, v in d_beer.items()
+                                        if k in d_query.get('query', '')}}]} # i.e. only fields asked for
+
+        if d_query.get('operationName') == 'beerSearch':
+            d_data = {'searchResultsArr': hits(d_vars.get('query', ''))}
+        else:
+            d_data = {'b' + k[1:]: hits(v) for k, v in d_vars.items()}
+        return 200, 'application/json', json.dumps({'data': d_data})
+
+    if host.endswith('beermenus.com'): # "synthetic N" -> bar w N beers
+        if path.startswith('/search'):
+            n = (re.findall('[0-9]+', q) or ['50'])[0]
+            return html('<h3 class="mb-0 text-normal"><a href="/places/synthetic-{}">'
+                        'Synthetic {}</a></h3>'.format(n, n))
+
+        match = re.search('/places/synthetic-([0-9]+)', path)
+        if match:
+            return html('<ul>', *(
+                '<li class="pure-list-item"><a href="/beers/{}">{}</a>'
+                '<p class="caption text-gray mb-0">{} · {:.1f}% ABV · Nowhere, NY</p>'
+                '<p class="caption text-right mb-0">16oz {} $7</p></li>'.format(
+                    slug(name), name, stats(name)[2], stats(name)[1],
+                    SERVINGS[i % len(SERVINGS)])
+                for i, name in enumerate(synthetic_beers(int(match.group(1))))), '</ul>')
+
+    return None
+
+
+class StandIn(object):
+    """
+    threaded local server: /{scheme}/{host}/{path}?{query} -> recorded (or synthetic) response
+    """
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency=LATENCY, jitter=JITTER,
+                 synthetic=True, pad=PAD, throttle=0, retry_after=RETRY_AFTER, port=0):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.synthetic = synthetic
+        self.pad = pad
+        self.throttle = throttle       # fraction of requests answered 429 (w Retry-After), like a site pushing back
+        self.retry_after = retry_after
+
+        self.hits = {'fixture': 0, 'synthetic': 0, 'missing': 0, 'throttled': 0}
+        self.first_request = None # time.time() of first request in, e.g. to time startup
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return 'http://{}:{}'.format(host, port)
+
+    def respond(self, method, url, body=None):
+        """
+        original request -> (status, headers, text)
+        """
+        if self.throttle and random.random() < self.throttle:
+            self.hits['throttled'] += 1
+            return 429, {'Content-Type': 'text/plain', 'Retry-After': str(self.retry_after)}, 'slow down'
+
+        try:
+            with open(fixture_path(self.fixtures_dir, method, url, body)) as f:
+                d = json.load(f)
+            self.hits['fixture'] += 1
+            return d['status'], d['headers'], d['text']
+
+        except(FileNotFoundError):
+            response = synthesize(method, url, body, pad=self.pad) if self.synthetic else None
+
+        if response is None:
+            self.hits['missing'] += 1
+            return 404, {'Content-Type': 'text/plain'}, 'no fixture for {} {}'.format(method, url)
+
+        self.hits['synthetic'] += 1
+        status, content_type, text = response
+        return status, {'Content-Type': content_type}, text
+
+    def make_handler(standin):
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive, like the real sites
+
+            def handle_request(self, method):
+                if standin.first_request is None:
+                    standin.first_request = time.time()
+
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8') if length else None
+
+                # /https/untappd.com/b/..?q=.. -> https://untappd.com/b/..?q=..
+                url = self.path.lstrip('/').replace('/', '://', 1)
+                status, headers, text = standin.respond(method, url, body)
+
+                time.sleep(max(0, standin.latency + random.uniform(-standin.jitter,
+                                                                   standin.jitter)))
+
+                content = text.encode('utf-8')
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='local stand-in server for lsbeer benchmarks')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help='recorded fixtures dir (default: bench/fixtures/http)')
+    parser.add_argument('--latency', type=float, default=1000 * LATENCY,
+                        help='ms per response (default: {:.0f})'.format(1000 * LATENCY))
+    parser.add_argument('--jitter', type=float, default=1000 * JITTER,
+                        help='+/- ms per response (default: {:.0f})'.format(1000 * JITTER))
+    parser.add_argument('--pad', type=int, default=PAD,
+                        help='KB filler per synthetic beerpage (default: {})'.format(PAD))
+    parser.add_argument('--no-synthetic', action='store_true',
+                        help='404 rather than make up pages w/o fixture')
+    parser.add_argument('--throttle', type=float, default=0,
+                        help='fraction of requests answered 429 (default: 0)')
+    parser.add_argument('--retry-after', type=int, default=RETRY_AFTER,
+                        help='s, in Retry-After of throttled responses (default: {})'.format(RETRY_AFTER))
+    args = parser.parse_args()
+
+    standin = StandIn(args.fixtures, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                      synthetic=(not args.no_synthetic), pad=args.pad, throttle=args.throttle,
+                      retry_after=args.retry_after, port=args.port)
+    print('serving {} on {} (LSBEER_STANDIN={})'.format(args.fixtures, standin.url, standin.url))
+    try:
+        standin.server.serve_forever()
+    except(KeyboardInterrupt):
+        standin.stop()
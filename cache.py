@@ -0,0 +1,248 @@
+from collections import OrderedDict
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from profiling import count
+from sites import DAY, HOUR, REGISTRY
+
+
+CACHE_DIR = os.environ.get('LSBEER_CACHE_DIR', os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'lsbeer'))
+CACHE_PATH = os.path.join(CACHE_DIR, 'cache.sqlite')
+
+# ratings barely move day to day (see sites.py)
+D_TTLS = dict(
+    {site.name: site.ttl for site in REGISTRY.values()},
+    _beerpages = 30 * DAY, # resolved {site: beer_url} maps
+    _bar = 30 * DAY,       # query -> (barname, bar_url)
+    _menu = HOUR / 4,      # bar_url -> menu snapshot (revalidated once stale)
+    _state = 365 * DAY     # bar_url -> last menu & results, for --diff
+)
+DEFAULT_TTL = DAY
+NOTFOUND_TTL = DAY  # empty results (i.e. beer not found) are retried sooner
+
+MAX_ENTRIES = 50000 # LRU eviction beyond this many rows
+EVICT_EVERY = 100   # puts between size checks
+
+MAX_MEMORY_ENTRIES = 20000 # in-memory layer (long-running process only)
+
+
+def normalize(beername):
+    """
+    beername -> normalized key (lowercase, no accents, collapsed whitespace)
+    """
+    beername = unicodedata.normalize('NFKD', beername)
+    beername = ''.join(c for c in beername if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', beername).strip().lower()
+
+
+class SqliteStore(object):
+    """
+    sqlite db w connections per-thread & per-process, so safe to share across threads or a forked Pool
+    """
+    SCHEMA = ()
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        pid = os.getpid()
+
+        if getattr(self._local, 'pid', None) != pid: # new thread or forked process
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL') # concurrent readers + 1 writer
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+            self._local.conn, self._local.pid = conn, pid
+
+        return self._local.conn
+
+
+class Cache(SqliteStore):
+    """
+    sqlite-backed cache of {(beername, site): stats dict}, w per-site TTLs & LRU eviction
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS reviews ('
+        'name TEXT NOT NULL, '
+        'site TEXT NOT NULL, '
+        'stats TEXT NOT NULL, '
+        'stored REAL NOT NULL, '
+        'accessed REAL NOT NULL, '
+        'PRIMARY KEY (name, site))',
+        'CREATE INDEX IF NOT EXISTS reviews_accessed ON reviews (accessed)'
+    )
+
+    def __init__(self, path=CACHE_PATH, ttls=D_TTLS, max_entries=MAX_ENTRIES):
+        super().__init__(path)
+
+        self.ttls = ttls
+        self.max_entries = max_entries
+
+        self._n_puts = 0
+
+    def ttl(self, site, stats=None):
+        return (NOTFOUND_TTL if stats == {} else
+                self.ttls.get(site, DEFAULT_TTL))
+
+    def lookup(self, key, site):
+        """
+        normalized beername, site -> (stats dict, stored timestamp) (or None)
+        """
+        row = self.conn.execute('SELECT stats, stored FROM reviews WHERE name = ? AND site = ?',
+                                (key, site)).fetchone()
+        return (json.loads(row[0]), row[1]) if row is not None else None
+
+    def touch(self, key, site, now):
+        self.conn.execute('UPDATE reviews SET accessed = ? WHERE name = ? AND site = ?',
+                          (now, key, site))
+
+    def get(self, name, site, ttl=None, since=None, counted=True):
+        """
+        beername, site -> cached stats dict (or None if missing / expired / stored before `since`)
+
+        :counted: toward hit rate ? (i.e. False for probes, so each lookup counts once)
+        """
+        key = normalize(name)
+
+        found = self.lookup(key, site)
+        if found is None:
+            if counted:
+                count('cache.miss:' + site)
+            return None
+
+        stats, stored = found
+        now = time.time()
+
+        if (now - stored > (ttl if ttl is not None else self.ttl(site, stats)) or # stale
+            (since is not None and stored < since)):                             # refreshed since
+            if counted:
+                count('cache.miss:' + site)
+            return None
+
+        if counted:
+            count('cache.hit:' + site)
+
+        self.touch(key, site, now)
+        return stats
+
+    def staleness(self, name, site):
+        """
+        beername, site -> age as fraction of TTL, i.e. >= 1 once expired (or None if missing)
+        """
+        found = self.lookup(normalize(name), site)
+        if found is None:
+            return None
+
+        stats, stored = found
+        return (time.time() - stored) / self.ttl(site, stats)
+
+    def put(self, name, site, stats):
+        now = time.time()
+        self.conn.execute('INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?)',
+                          (normalize(name), site, json.dumps(stats), now, now))
+
+        self._n_puts += 1
+        if self._n_puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        drop least recently accessed rows beyond max_entries
+        """
+        n, = self.conn.execute('SELECT COUNT(*) FROM reviews').fetchone()
+
+        if n > self.max_entries:
+            self.conn.execute('DELETE FROM reviews WHERE rowid IN ('
+                              'SELECT rowid FROM reviews ORDER BY accessed ASC LIMIT ?)',
+                              (n - self.max_entries,))
+
+    def clear(self):
+        self.conn.execute('DELETE FROM reviews')
+
+
+class MemoryCache(Cache):
+    """
+    Cache w in-memory LRU layer in front of sqlite, for long-running processes (i.e. `lsbeer serve`)
+
+    entries are kept serialized, so callers get their own copy (as from sqlite)
+    """
+
+    def __init__(self, path=CACHE_PATH, max_memory_entries=MAX_MEMORY_ENTRIES, **kwargs):
+        super().__init__(path, **kwargs)
+
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict() # (name, site) -> (stats json, stored)
+        self._memory_lock = threading.Lock()
+
+    def remember(self, key, site, stats_json, stored):
+        with self._memory_lock:
+            self.memory[(key, site)] = (stats_json, stored)
+            self.memory.move_to_end((key, site))
+
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+
+    def lookup(self, key, site):
+        with self._memory_lock:
+            found = self.memory.get((key, site))
+            if found is not None:
+                self.memory.move_to_end((key, site))
+
+        if found is not None:
+            count('cache.memory:' + site)
+            stats_json, stored = found
+            return json.loads(stats_json), stored
+
+        found = super().lookup(key, site)
+        if found is not None:
+            stats, stored = found
+            self.remember(key, site, json.dumps(stats), stored)
+            super().touch(key, site, time.time()) # (only on the way in)
+        return found
+
+    def touch(self, key, site, now):
+        pass # i.e. memory hit
+
+    def put(self, name, site, stats):
+        super().put(name, site, stats)
+        self.remember(normalize(name), site, json.dumps(stats), time.time())
+
+    def clear(self):
+        super().clear()
+        with self._memory_lock:
+            self.memory.clear()
+
+
+_CACHE = None
+
+def get_cache():
+    """
+    -> module-level cache (lazily created)
+    """
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = Cache()
+    return _CACHE
+
+
+def use_memory(max_memory_entries=MAX_MEMORY_ENTRIES):
+    """
+    swap module-level cache for one w in-memory layer
+    """
+    global _CACHE
+    _CACHE = MemoryCache(max_memory_entries=max_memory_entries)
+    return _CACHE
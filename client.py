@@ -0,0 +1,207 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from urllib.parse import urlencode
+
+from output import FORMATS, SITES, format_key, format_simple, get_writer
+
+
+# thin client for `lsbeer serve`: stdlib only (+ output), so it answers w/o paying for scraper imports
+
+ENV_SERVER = 'LSBEER_SERVER'     # host:port or path/to/socket
+DEFAULT_SERVER = '127.0.0.1:8790'
+
+CONNECT_TIMEOUT = 0.2 # s, before falling back to running locally
+
+GET_BEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'get_beer.py')
+
+
+def is_unix(address):
+    return '/' in address or not address.rpartition(':')[2].isdigit()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connect(address, timeout=CONNECT_TIMEOUT):
+    """
+    address -> open connection (or raise OSError, if no server there)
+    """
+    if is_unix(address):
+        conn = UnixHTTPConnection(address, timeout=timeout)
+    else:
+        host, port = address.rsplit(':', 1)
+        conn = http.client.HTTPConnection(host, int(port), timeout=timeout)
+
+    conn.connect()
+    conn.sock.settimeout(None) # lookups may take a while
+    return conn
+
+
+def query(conn, path, params={}, body=None):
+    """
+    connection, endpoint, params (& json body) -> iterator of dicts, as they land
+    """
+    url = '{}?{}'.format(path, urlencode(params, doseq=True))
+
+    if body is None:
+        conn.request('GET', url)
+    else:
+        conn.request('POST', url, body=json.dumps(body),
+                     headers={'Content-Type': 'application/json'})
+
+    response = conn.getresponse()
+    if response.status != 200:
+        raise RuntimeError('{} {}'.format(response.status, response.reason))
+
+    for line in response:
+        d = json.loads(line)
+        if 'error' in d:
+            raise RuntimeError(d['error'])
+        yield d
+
+
+def get_d_stats(record):
+    """
+    record -> sitesdict of statsdicts (as in get_beer)
+    """
+    return dict(record['sites'], beermenus=record['beermenus'])
+
+
+def is_kept(record, filter_by):
+    styles = {(stats or {}).get('style', '').lower()
+              for stats in get_d_stats(record).values()}
+    return not filter_by or bool(styles & {style.lower() for style in filter_by})
+
+
+def sort_key(record, sort_by=None):
+    avg = record['rating'] if record['rating'] is not None else -1
+    if not sort_by:
+        return avg
+
+    try:
+        return float(record['sites'][sort_by]['rating']), avg
+    except(KeyError, TypeError, ValueError):
+        return -1, avg
+
+
+def get_parser():
+
+    parser = argparse.ArgumentParser(description='lsbeer, via `lsbeer serve` if running (else locally)')
+    parser.add_argument('bar', nargs='*')
+    parser.add_argument('-f', nargs='*', default=[],
+                        help='path/to/beerfile')
+    parser.add_argument('--sorted', action='store_true',
+                        help='sort by average rating? (default: false)')
+    parser.add_argument('--sort-by', default=None, choices=SITES,
+                        help='ratings website to sort by? (default: none)')
+    parser.add_argument('--filter-by', nargs='*', default=[],
+                        help='style/s to filter by? (default: all styles)')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='taps AND cans & bottles ? (default: taps only)')
+    parser.add_argument('--just-cans', action='store_true',
+                        help='cans & bottles only ? (default: taps only)')
+    parser.add_argument('-t', '--nthreads', type=int, default=None,
+                        help='concurrent requests per site (default: server\'s)')
+    parser.add_argument('--deadline', type=float, default=None)
+    parser.add_argument('--site-timeout', type=float, default=None)
+    parser.add_argument('--hedge', action='store_true')
+    parser.add_argument('--refresh', action='store_true')
+    parser.add_argument('--offline', action='store_true')
+    parser.add_argument('--format', default='text', choices=FORMATS)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('--server', default=os.environ.get(ENV_SERVER, DEFAULT_SERVER),
+                        help='host:port or path/to/socket (default: ${} or {})'.format(
+                            ENV_SERVER, DEFAULT_SERVER))
+    return parser
+
+
+def run_locally(argv):
+    os.execv(sys.executable, [sys.executable, GET_BEER] + list(argv))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    args, unknown = get_parser().parse_known_args(argv)
+
+    if argv[:1] in (['serve'], ['prefetch']) or unknown or not (args.bar or args.f): # i.e. not for the server
+        run_locally(argv)
+
+    try:
+        conn = connect(args.server)
+    except(OSError): # no server -> same thing, slower
+        run_locally(argv)
+
+    params = {k: v for k, v in (('refresh', int(args.refresh)), ('offline', int(args.offline)),
+                                ('nthreads', args.nthreads), ('deadline', args.deadline),
+                                ('site_timeout', args.site_timeout), ('hedge', int(args.hedge)))
+              if v}
+
+    if args.bar:
+        params.update(bar=' '.join(args.bar), taps=int(not args.just_cans),
+                      cans=int(args.all or args.just_cans))
+        results = query(conn, '/menu', params)
+    else:
+        beerfile = ' '.join(args.f)
+        with open(beerfile) as f:
+            beerlst = [line.strip() for line in f if line.strip()]
+        results = query(conn, '/beers', params, body={'beers': beerlst,
+                                                      'bar': beerfile.split('_')[-1]})
+
+    try:
+        header = next(results)
+    except(RuntimeError) as e:
+        print('\n{}\n'.format(e))
+        sys.exit(0)
+
+    if args.format != 'text':
+        f = ((open(args.output, 'wb') if args.format == 'parquet' else
+              open(args.output, 'w', newline='')) if args.output else sys.stdout)
+        with get_writer(args.format, f) as writer:
+            for record in results:
+                if is_kept(record, args.filter_by):
+                    writer.write(record['bar'], record['beer'], get_d_stats(record))
+        return
+
+    print('\n what\'s on @ {} ?? \n'.format(header['bar'].upper()))
+
+    maxwidth = max((len(beer) for beer in header['taps'] + header['cans']), default=0)
+    pprint = lambda record: print(format_simple(record['beer'], get_d_stats(record),
+                                                maxwidth, spacer='  '), flush=True)
+
+    kept = []
+    for record in results: # as they land
+        if not is_kept(record, args.filter_by):
+            continue
+        kept.append(record)
+
+        if not (args.sorted or args.sort_by):
+            pprint(record)
+
+    if not kept:
+        print('overly filtered beers\n')
+        sys.exit(0)
+
+    if args.sorted or args.sort_by:
+        for record in sorted(kept, key=lambda record: sort_key(record, args.sort_by),
+                             reverse=True): # best -> worst
+            pprint(record)
+
+    print('\n{}\n'.format(format_key(spacer='  ')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+from profiling import count, span
+
+
+MAX_PER_HOST = 4 # requests in flight per site (unless set per host)
+
+RESOLVER = 'google' # host for beerpage resolution
+
+PENDING = {'pending': True} # stats for site that missed its deadline (or failed, e.g. blocked)
+
+HEDGE_QUANTILE = 0.9 # latency past which a duplicate request is sent..
+HEDGE_MIN_SAMPLES = 20 # .. once there's enough history to know
+
+# host -> recent latencies (s), kept across runs in this process
+LATENCIES = defaultdict(lambda: deque(maxlen=200))
+
+
+def latency_quantile(host, q=HEDGE_QUANTILE):
+    """
+    host, quantile -> recent latency at quantile (or None, if too few samples)
+    """
+    samples = sorted(LATENCIES[host])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+def run_in_thread(loop, fn, *args):
+    """
+    blocking fn -> future of its result, from a daemon thread (so a straggler still running past the deadline
+                   can't keep the process from exiting, as an executor's worker would)
+    """
+    future = loop.create_future()
+
+    def settle(result, e):
+        if future.done(): # (cancelled, i.e. abandoned)
+            return
+        if e is not None:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def target():
+        result, e = None, None
+        try:
+            result = fn(*args)
+        except(BaseException) as e_:
+            e = e_
+        try:
+            loop.call_soon_threadsafe(settle, result, e)
+        except(RuntimeError): # loop closed, i.e. run over
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+def iter_run(beerlst, sites, get_stats, **kwargs):
+    """
+    lst of beers -> iterator of (beer, d_stats) in order of completion, w all (beer, site) pairs fetched
+                    concurrently
+
+    event loop runs in a background thread, so results can be consumed (e.g. printed) as they land
+    (& w a window, at most that many wait to be consumed before the loop holds off)
+
+    :sites: site names (each treated as its own host)
+    :get_stats: fn(beer, site, beerpages) -> statsdict (blocking), w beerpages None if site doesn't wait on
+                resolve
+    :resolve: fn(beer) -> {site: beer_url} (blocking), run once per beer before its resolved sites
+    :resolved: sites that wait on resolve (default: all) .. the rest start straight away
+    :max_concurrency: total requests in flight (default: sum of per host, so a slow site only ever ties up
+                      its own share, & adding one doesn't cost the others)
+    :max_per_host: requests in flight per host, unless in per_host
+    :per_host: {host: requests in flight}
+    :deadline: s for whole run, after which any missing sites are PENDING
+    :site_timeouts: {site: s} soft timeout per request, after which that site is PENDING
+    :hedge: send duplicate request when one runs past its site's p90 latency ?
+    :window: at most this many beers in flight, drawn from beerlst (any iterable, e.g. lazily read) as
+             earlier ones finish, so memory stays flat
+    """
+    q = queue.Queue(maxsize=(kwargs.get('window') or 0))
+    DONE = object()
+
+    stopped = threading.Event() # i.e. consumer gone
+    d_running = {}
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except(queue.Full):
+                pass
+
+    async def run_():
+        d_running.update(loop=asyncio.get_running_loop(), task=asyncio.current_task())
+        await _run(beerlst, sites, get_stats, on_done=lambda *result: put(result), **kwargs)
+
+    def target():
+        try:
+            asyncio.run(run_())
+        except(BaseException) as e: # -> reraised in consumer
+            put(e)
+        finally:
+            put(DONE)
+
+    threading.Thread(target=target, daemon=True).start()
+
+    finished = False
+    try:
+        while True:
+            item = q.get()
+
+            if item is DONE or isinstance(item, BaseException):
+                finished = True
+            if item is DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+
+            yield item
+
+    finally:
+        stopped.set()
+        if not finished and d_running: # e.g. interrupted -> cancel the rest, rather than leave it running
+            try:
+                d_running['loop'].call_soon_threadsafe(d_running['task'].cancel)
+            except(RuntimeError): # (just finished)
+                pass
+
+
+async def _run(beerlst, sites, get_stats, resolve=None, resolved=None, max_concurrency=None,
+               max_per_host=MAX_PER_HOST, per_host={}, on_done=None, deadline=None,
+               site_timeouts={}, hedge=False, window=None):
+    loop = asyncio.get_running_loop()
+
+    t_end = loop.time() + deadline if deadline is not None else None
+
+    resolved = set(sites if resolved is None else resolved) if resolve else set()
+
+    d_limits = {host: per_host.get(host, max_per_host)
+                for host in list(sites) + ([RESOLVER] if resolved else [])}
+    max_concurrency = max_concurrency or sum(d_limits.values())
+
+    sem = asyncio.Semaphore(max_concurrency)
+    d_sems = {host: asyncio.Semaphore(limit) for host, limit in d_limits.items()}
+
+    # scrapers are blocking, so each request gets a (daemon) thread.. but only while it holds both limits
+    # (on deadline, stragglers are abandoned rather than awaited)
+    async def call(host, fn, *args):
+        async with d_sems[host], sem:
+            t = loop.time()
+            result = await run_in_thread(loop, fn, *args)
+            LATENCIES[host].append(loop.time() - t)
+            return result
+
+    def time_left(host):
+        timeouts = [site_timeouts.get(host), (t_end - loop.time()) if t_end else None]
+        timeouts = [t for t in timeouts if t is not None]
+        return max(0, min(timeouts)) if timeouts else None
+
+    async def call_by_deadline(host, fn, *args):
+        """
+        -> result, or PENDING if not back in time (first of original & hedged request, if any) or failed,
+           so 1 site's error (e.g. ip blocked) costs just that beer's site, not the whole run
+        """
+        timeout = time_left(host)
+        tasks = {asyncio.ensure_future(call(host, fn, *args))}
+
+        try:
+            t_hedge = latency_quantile(host) if hedge else None
+            if t_hedge is not None and (timeout is None or t_hedge < timeout):
+                done, _ = await asyncio.wait(tasks, timeout=t_hedge)
+                if not done: # slow -> race a duplicate
+                    tasks.add(asyncio.ensure_future(call(host, fn, *args)))
+                    timeout = timeout - t_hedge if timeout is not None else None
+
+            done, _ = await asyncio.wait(tasks, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                return PENDING
+
+            try:
+                return done.pop().result()
+            except(Exception):
+                count('error:' + host)
+                return PENDING
+
+        finally: # losers, or all if cancelled (thread itself runs on, & still caches its result)
+            for task in tasks:
+                task.cancel()
+
+    async def do_beer(beer):
+        # resolved sites wait on beerpages, the rest needn't (i.e. they search for themselves)
+        resolving = (asyncio.ensure_future(call_by_deadline(RESOLVER, resolve, beer))
+                     if resolved else None)
+
+        async def do_site(site):
+            beerpages = await asyncio.shield(resolving) if site in resolved else None
+            if beerpages is PENDING: # out of time
+                return PENDING
+            return await call_by_deadline(site, get_stats, beer, site, beerpages)
+
+        try:
+            with span('beer'):
+                statss = await asyncio.gather(*(do_site(site) for site in sites))
+        finally:
+            if resolving is not None:
+                resolving.cancel()
+        d_stats = dict(zip(sites, statss))
+
+        if on_done:
+            on_done(beer, d_stats)
+
+        return beer, d_stats
+
+    async def do_window():
+        """
+        beers drawn as slots free up, w next one read off loop (reading may block, e.g. on file or index)
+        """
+        beers, tasks, exhausted = iter(beerlst), set(), False
+        reader = ThreadPoolExecutor(1)
+        DONE = object()
+
+        try:
+            while True:
+                while not exhausted and len(tasks) < window:
+                    beer = await loop.run_in_executor(reader, next, beers, DONE)
+                    if beer is DONE:
+                        exhausted = True
+                    else:
+                        tasks.add(asyncio.ensure_future(do_beer(beer)))
+
+                if not tasks:
+                    return {}
+
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result() # (reraise)
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            reader.shutdown(wait=False)
+
+    if window is not None:
+        return await do_window()
+    results = await asyncio.gather(*(do_beer(beer) for beer in beerlst))
+
+    return dict(results)
@@ -1,36 +1,257 @@
 import argparse
 from collections import defaultdict
-import re
+from functools import partial, wraps
+from importlib import import_module
+from itertools import chain
 import sys
+import time
 
-from tqdm import tqdm
+from cache import get_cache
+from names import canonicalize
+from output import (FORMATS, SITE_FIELDS, SITES, TEXT_FIELDS, as_dict, format_abv, format_key,
+                    format_rating, format_simple, get_info_ranked, get_writer)
+from profiling import count, span
+from records import LazyStats, Stats
+from sites import REGISTRY, batched, covers, needs, resolved
 
-from CLIppy import fail_gracefully, flatten, get_from_file, safe_encode, soup_me
 
-from scrapers import get_bar, get_beers, get_reviews_ratebeer, get_reviews_untappd, get_reviews_beeradvocate, get_beerpages_en_masse
+# heavy deps (scrapers -> requests, bs4; CLIppy; tqdm) are imported on first use rather than at startup,
+# so e.g. `-h` or a fully cached run never pays for them (see bench/bench_startup.py)
 
+def lazy(module, name):
+    """
+    module, attribute name -> fn that imports module on first call
+    """
+    def fn(*args, **kwargs):
+        return getattr(import_module(module), name)(*args, **kwargs)
+    fn.__name__ = fn.__qualname__ = name
+    return fn
+
+
+def fail_gracefully(f):
+    # i.e. CLIppy.fail_gracefully, w CLIppy only imported if something does fail
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except(BaseException) as e:
+            from CLIppy import fail_gracefully as fail_gracefully_
+
+            def reraise():
+                raise e
+            return fail_gracefully_(reraise)()
+    return wrapper
+
+
+flatten = lazy('CLIppy', 'flatten')
+get_from_file = lazy('CLIppy', 'get_from_file')
+
+get_bar = lazy('scrapers', 'get_bar')
+get_beers_if_changed = lazy('scrapers', 'get_beers_if_changed')
+get_beerpages_en_masse = lazy('scrapers', 'get_beerpages_en_masse')
+
+# per site lookups, as registered (see sites.py)
+D_ACTIONS = {site: lazy(*REGISTRY[site].lookup) for site in SITES}
+
+# sites that can look up many beers per request
+D_BATCH_ACTIONS = {site: lazy(*REGISTRY[site].batch_lookup) for site in batched()}
+
+
+BEERPAGES = '_beerpages' # cache key for resolved {site: beer_url}
+BAR = '_bar'             # cache key for (barname, bar_url)
+MENU = '_menu'           # cache key for menu snapshot
+STATE = '_state'         # cache key for last run's menu & results
+
+
+def refreshed_since(refresh):
+    """
+    refresh (bool or timestamp) -> timestamp before which cache entries count as stale (or None)
+    """
+    if not refresh:
+        return None
+    return time.time() if refresh is True else refresh
+
+
+def get_beerpages(beer, refresh=False, offline=False):
+    """
+    beer -> {site: beer_url}, via (cached) search
+    """
+    cache = get_cache()
+
+    beerpages = cache.get(canonicalize(beer), BEERPAGES, since=refreshed_since(refresh))
+
+    if beerpages is None:
+        if offline:
+            return {}
+        with span('resolve'):
+            beerpages = get_beerpages_en_masse(beer)
+        cache.put(canonicalize(beer), BEERPAGES, beerpages)
 
+    return beerpages
 
-D_ACTIONS = dict(
-    untappd = get_reviews_untappd,
-    ratebeer = get_reviews_ratebeer,
-    beeradvocate = get_reviews_beeradvocate
-)
 
+def try_get_beerpages(beer, refresh=False, offline=False):
+    """
+    beer -> {site: beer_url}, or {} if search failed (so sites search for themselves, & nothing's cached)
+    """
+    try:
+        return get_beerpages(beer, refresh=refresh, offline=offline)
+    except(Exception):
+        count('error:resolve')
+        return {}
+
+
+def get_bar_cached(query, refresh=False):
+    """
+    query -> (barname, bar_url), via (cached) search
+    """
+    cache = get_cache()
+
+    bar = cache.get(query, BAR, since=refreshed_since(refresh))
+
+    if bar is None:
+        with span('bar'):
+            bar = get_bar(query)
+        cache.put(query, BAR, bar)
+
+    return tuple(bar)
+
+
+def get_beers_cached(bar_url, refresh=False, offline=False):
+    """
+    bar_url -> {beername: beermenus stats}, from cache if fresh / else revalidated
+    """
+    cache = get_cache()
+
+    snapshot = cache.get(bar_url, MENU, since=refreshed_since(refresh))
+    if snapshot is not None: # fresh
+        return snapshot['beers']
+
+    stale = cache.get(bar_url, MENU, ttl=float('inf'), counted=False) # (already counted as miss)
+    if stale is not None and offline:
+        return stale['beers']
+
+    with span('menu'):
+        snapshot = get_beers_if_changed(bar_url, snapshot=(stale if not refresh else None))
+    cache.put(bar_url, MENU, snapshot) # (re)stamp as fresh
+
+    return snapshot['beers']
+
+
+def diff_menus(d_old, d_new):
+    """
+    old & new {beername: beermenus stats} -> (added, removed, changed) sets of beernames
+    """
+    added = set(d_new.keys()) - set(d_old.keys())
+    removed = set(d_old.keys()) - set(d_new.keys())
+    changed = {beer for beer in set(d_new.keys()) & set(d_old.keys())
+               if d_new[beer] != d_old[beer]} # e.g. serving / price
+
+    return added, removed, changed
 
-def get_d_stats(beer, verbose=False):
+
+def needs_scraping(beer, refresh=False, offline=False, sites=SITES, fields=SITE_FIELDS):
+    """
+    beer -> any of sites missing from review cache (or fields from cached reviews) ?
+    """
+    if offline:
+        return False
+
+    cache = get_cache()
+    since = refreshed_since(refresh)
+    key = canonicalize(beer)
+    return any(not covers(cache.get(key, site, since=since, counted=False), site, fields)
+               for site in sites)
+
+
+def resolve_beerpages(beerlst, nthreads=1, refresh=False, offline=False, sites=SITES,
+                      fields=SITE_FIELDS):
+    """
+    lst of beers -> {beer: {site: beer_url}}
+
+    one search per beer (& only for beers w reviews left to scrape, from sites that take a beerpage),
+    rather than one per beer per site
+    """
+    to_resolve = [beer for beer in beerlst if needs_scraping(beer, refresh=refresh,
+                                                             offline=offline,
+                                                             sites=resolved(sites),
+                                                             fields=fields)]
+    get_beerpages_ = partial(try_get_beerpages, refresh=refresh, offline=offline)
+
+    if nthreads > 1 and len(to_resolve) > 1:
+        from multiprocessing.pool import ThreadPool # network-bound, so threads suffice
+
+        with ThreadPool(min(nthreads, len(to_resolve))) as p:
+            beerpages = p.map(get_beerpages_, to_resolve)
+    else:
+        beerpages = [get_beerpages_(beer) for beer in to_resolve]
+
+    return dict(zip(to_resolve, beerpages))
+
+
+def lazy_kwargs(site, fields):
+    # i.e. only lookups of sites w lazy fields take `fields`
+    return {'fields': fields} if REGISTRY[site].lazy_fields else {}
+
+
+def get_site_stats(beer, site, beerpages=None, verbose=False, refresh=False,
+                   offline=False, fields=SITE_FIELDS, counted=True):
+    """
+    beer, site -> Stats, from cache or else scraped
+
+    :fields: wanted, i.e. site's lazy ones (e.g. ratebeer descriptions) only fetched if here, & description
+             text only kept if here (though cached, regardless)
+    :counted: toward cache hit rate ? (i.e. False if batch prefetch already counted it)
+    """
+    cache = get_cache()
+
+    stats = cache.get(canonicalize(beer), site, since=refreshed_since(refresh), counted=counted)
+
+    if not covers(stats, site, fields) and not offline: # cache miss (or cached w/o field now wanted) -> scrape
+        if beerpages is None:
+            beerpages = (try_get_beerpages(beer, refresh=refresh) if REGISTRY[site].needs_resolver
+                         else {})
+
+        with span('site:' + site):
+            try:
+                stats = D_ACTIONS[site](beer, verbose=verbose,
+                                        # fallback is beerpage-specific search
+                                        beerpage=beerpages.get(site, None),
+                                        **lazy_kwargs(site, fields))
+            except(Exception) as e: # e.g. ip blocked -> just this site left pending (& uncached)
+                count('error:' + site)
+                if verbose:
+                    print('{} failed: {}'.format(site, e))
+                return Stats(pending=True)
+        cache.put(canonicalize(beer), site, stats)
+
+    elif verbose:
+        print('{} (cached)...'.format(site))
+
+    return Stats.from_dict(stats if stats is not None else {}, # offline miss -> not found
+                           descriptions=('description' in fields))
+
+
+def get_d_stats(beer, verbose=False, refresh=False, offline=False,
+                beerpages=None, fields=SITE_FIELDS, sites=SITES, prefetched=()):
     # fn must be outer to be pickleable, and therefore eligible for multiprocessing
+    # (prefetched: sites batch looked up already, & so counted toward cache hit rate)
 
     if verbose:
         print('looking up {} drinkability...'.format(beer.upper()))
 
-    # dictionary of stats dictionaries
-    d_stats = {
-        site: action(beer, verbose=verbose,
-                     # fallback is beerpage-specific search
-                     beerpage=get_beerpages_en_masse(beer).get(site, None))
-        for site, action in D_ACTIONS.items()
-    }
+    with span('beer'):
+        if beerpages is None and needs_scraping(beer, refresh=refresh, offline=offline,
+                                                sites=resolved(sites), fields=fields):
+            beerpages = try_get_beerpages(beer, refresh=refresh) # resolve once per beer, not per site
+
+        # dictionary of stats dictionaries
+        d_stats = {
+            site: get_site_stats(beer, site, beerpages=beerpages, verbose=verbose,
+                                 refresh=refresh, offline=offline, fields=fields,
+                                 counted=(site not in prefetched))
+            for site in sites
+        }
 
     if verbose:
         print('& done.')
@@ -38,26 +259,149 @@ def get_d_stats(beer, verbose=False):
     return d_stats
 
 
-def populate_beer_dict(beerlst, nthreads=4, verbose=False):
+def prefetch_batched(beerlst, refresh=False, offline=False, verbose=False, sites=SITES,
+                     fields=SITE_FIELDS):
     """
-    lst of beers -> beerdict of sitesdicts of statsdicts
+    lst of beers -> None, after caching reviews from sites w batch lookup (so per-beer lookups are cache hits)
+    """
+    if offline:
+        return
+
+    cache = get_cache()
+    since = refreshed_since(refresh)
+
+    for site in batched(sites):
+        to_fetch = [beer for beer in beerlst
+                    if not covers(cache.get(canonicalize(beer), site, since=since), site, fields)]
+        if not to_fetch:
+            continue
+
+        with span('batch:' + site):
+            d_stats = D_BATCH_ACTIONS[site](to_fetch, verbose=verbose, **lazy_kwargs(site, fields))
+
+        for beer, stats in d_stats.items():
+            cache.put(canonicalize(beer), site, stats)
+
+
+def _get_d_stats(args, **kwargs):
+    # (beer, beerpages) -> (beer, d_stats), i.e. unpacked for Pool.imap_unordered
+    beer, beerpages = args
+    return beer, get_d_stats(beer, beerpages=beerpages, **kwargs)
+
+
+def is_timed(deadline=None, site_timeouts=None, hedge=False):
+    """
+    -> any of the async engine's timing options set ?
     """
+    return deadline is not None or hedge or any(t is not None for t in (site_timeouts or {}).values())
+
+
+def iter_beer_dict(beerlst, nthreads=4, verbose=False, refresh=False,
+                   offline=False, engine='async', progress=True, fields=SITE_FIELDS,
+                   window=None, sites=SITES, **kwargs):
+    """
+    lst of beers -> iterator of (beer, sitesdict of Stats), in order of completion
+
+    :engine: 'async' (all beer x site requests concurrent, w nthreads per site, up to its own limit)
+             or 'pool' (nthreads processes, 1 beer each)
+    :fields: the output needs (default: all for rows, but descriptions), so sites w none of them are skipped &
+             lazy ones (e.g. ratebeer descriptions) only fetched if here
+    :sites: to look up (default: all registered, that provide any of fields)
+    :window: stream, w at most this many beers in flight (async engine), so beerlst may be any iterable,
+             e.g. lazily read (& isn't batch looked up up front)
+    :kwargs: deadline (incl batch lookups), site_timeouts, hedge (async engine only, even w 1 thread)
+    """
+    refresh = refreshed_since(refresh) # i.e. anything cached during this run is fresh
+    sites = tuple(needs(fields, sites))
+
+    if window is None:
+        prefetch = partial(prefetch_batched, beerlst, refresh=refresh, offline=offline,
+                           verbose=verbose, sites=sites, fields=fields)
+        deadline = kwargs.get('deadline')
+
+        if deadline is None:
+            prefetch()
+        else: # within deadline, & then per-beer lookups get what's left (w/o waiting on batch any longer)
+            import threading
+
+            t = time.time()
+            thread = threading.Thread(target=prefetch, daemon=True)
+            thread.start()
+            thread.join(deadline)
+            kwargs['deadline'] = max(0, deadline - (time.time() - t))
+
+    from tqdm import tqdm
+
+    with tqdm(total=(len(beerlst) if window is None else None),
+              disable=(not progress)) as pbar: # <- progress bar
+
+        for beer, d_stats in _iter_beer_dict(beerlst, nthreads=nthreads,
+                                             verbose=verbose, refresh=refresh,
+                                             offline=offline, engine=engine,
+                                             fields=fields, window=window, sites=sites,
+                                             **kwargs):
+            pbar.update()
+            yield beer, d_stats
+
+
+def _iter_beer_dict(beerlst, nthreads=4, verbose=False, refresh=False,
+                    offline=False, engine='async', fields=SITE_FIELDS, window=None, sites=SITES,
+                    **kwargs):
+
+    timed = is_timed(**kwargs)
+    prefetched = batched(sites) if window is None and not offline else () # (& counted there)
+
+    if (engine == 'async' and (nthreads > 1 or timed)) or window is not None:
+        import engine as engine_
+
+        def resolve(beer):
+            return (try_get_beerpages(beer, refresh=refresh)
+                    if needs_scraping(beer, refresh=refresh, offline=offline,
+                                      sites=resolved(sites), fields=fields)
+                    else {})
+
+        def get_stats(beer, site, beerpages):
+            return get_site_stats(beer, site, beerpages=beerpages, verbose=verbose,
+                                  refresh=refresh, offline=offline, fields=fields,
+                                  counted=(site not in prefetched))
+
+        yield from engine_.iter_run(beerlst, list(sites), get_stats, resolve=resolve,
+                                    resolved=resolved(sites), max_per_host=nthreads,
+                                    per_host={site: min(nthreads, REGISTRY[site].concurrency)
+                                              for site in sites},
+                                    window=window, **kwargs)
+        return
+
+    if timed:
+        print('(deadline, site timeouts & hedging are ignored by the pool engine)', file=sys.stderr)
+
+    # resolver stage: batch search for beerpages up front
+    d_beerpages = resolve_beerpages(beerlst, nthreads=nthreads, refresh=refresh,
+                                    offline=offline, sites=sites, fields=fields)
+    args = [(beer, d_beerpages.get(beer, {})) for beer in beerlst]
+
+    get_d_stats_ = partial(_get_d_stats, refresh=refresh, offline=offline,
+                           fields=fields, sites=sites, prefetched=prefetched) # still pickleable
 
     if nthreads > 1:
         from multiprocessing import Pool
 
         # TODO verbose not passed
-        # via https://stackoverflow.com/questions/41920124/multiprocessing-use-tqdm-to-display-a-progress-bar
         with Pool(nthreads) as p:
-            d_beers = dict(zip(beerlst, list( # list needed to finalize itable for tqdm
-                tqdm(p.imap(get_d_stats, beerlst), # <- progress bar
-                     total=len(beerlst)))))
+            yield from p.imap_unordered(get_d_stats_, args) # 1 slow beer doesn't hold up the rest
 
     else:
-        d_beers = {beer: get_d_stats(beer, verbose=verbose)
-                   for beer in tqdm(beerlst)} # <- progress bar
+        for arg in args:
+            yield get_d_stats_(arg, verbose=verbose)
+
 
-    return d_beers # dict of sitedicts of statsdicts
+def populate_beer_dict(beerlst, **kwargs):
+    """
+    lst of beers -> beerdict of sitesdicts of statsdicts
+    """
+    d_beers = dict(iter_beer_dict(beerlst, **kwargs))
+
+    return {beer: d_beers[beer] for beer in beerlst} # dict of sitedicts of statsdicts
 
 
 def get_beers_from_file(f):
@@ -68,33 +412,18 @@ def get_beers_from_file(f):
 
 
 def sort_beerlst(beerlst, d_beers, sorted_=False, sort_by=None):
+    """
+    lst of beers, beerdict of sitesdicts of statsdicts -> lst of beers, best -> worst
+       by avg rating (or by site's, then avg), w no reviews found listed last
+    """
     assert sorted_ or sort_by, 'Specify sorting by average or by site..'
 
-    def get_avg_rating(beer):
-        ratings = [float(d_stats['rating']) for d_stats in d_beers[beer].values()
-                   if d_stats and d_stats.__contains__('rating')] # skip empty / not found
-        try:
-            avg = sum(ratings) / len(ratings)
-        except(ZeroDivisionError):
-            avg = -1 # no reviews found - list last
-
-        return avg
-
-    def get_rating_by_site(beer, site):
-        try:
-            rating = d_beers[beer][site]['rating']
-        except(KeyError):
-            rating = -1 # no review found - list last
-
-        return rating
-
-    KEY = (get_avg_rating if sorted_ else                              # avg review
-           lambda x: (get_rating_by_site(x, sort_by), get_avg_rating)) # by site, then avg
+    from ranking import Table
 
-    return sorted(beerlst, key=KEY, reverse=True) # best -> worst
+    return Table.from_dicts(beerlst, d_beers).rank(sort_by=sort_by)
 
 
-def print_fancy(beer, d_stats, sep='|', spacer='  ', **kwargs):
+def print_fancy(beer, d_stats, sep='|', spacer='  ', marker='', **kwargs):
     PATTERN = '~*~'
     # SPACER = '  '
     # SEP = '|'
@@ -102,22 +431,23 @@ def print_fancy(beer, d_stats, sep='|', spacer='  ', **kwargs):
     # d_reviews = {k: v['rating'] for k,v in d_stats.items()
     #              if v} # skip empty / not found
 
-    style = get_info_ranked('style')
-    abv   = get_info_ranked('abv')
+    style = get_info_ranked(d_stats, 'style')
+    abv   = format_abv(get_info_ranked(d_stats, 'abv'))
 
     # header
-    print('\n{pattern} {} {pattern} ({}, {})\n'.format(beer,
-                                                       style,
-                                                       abv,
-                                                       pattern=PATTERN))
+    print('\n{}{pattern} {} {pattern} ({}, {})\n'.format(marker,
+                                                         beer,
+                                                         style,
+                                                         abv,
+                                                         pattern=PATTERN))
 
     # reviews
     sitetxt = ''.join(
         ('{spacer}',
          # '{spacer}{sep}{spacer}'.join(['({})'] * len(d_stats)),
-         '{spacer}{sep}{spacer}'.join(['({})'] * len(D_ACTIONS)),
+         '{spacer}{sep}{spacer}'.join(['({})'] * len(SITES)),
          # '{spacer}')).format(*d_stats.keys(), spacer=spacer, sep=sep)
-         '{spacer}')).format(*D_ACTIONS.keys(), spacer=spacer, sep=sep)
+         '{spacer}')).format(*SITES, spacer=spacer, sep=sep)
     # sitetxt = ''.join(
     #     ('{spacer}',
     #      '{spacer}{sep}{spacer}'.join(['({})'] * len(d_reviews)),
@@ -129,9 +459,9 @@ def print_fancy(beer, d_stats, sep='|', spacer='  ', **kwargs):
     # reviewtxt = '{sep}'.join(['{:^{}}'] * len(d_stats)).format(
     #     *flatten(zip((stats.get('rating', '') for stats in d_stats.values()),
     #                  widths)), sep=sep)
-    reviewtxt = '{sep}'.join(['{:^{}}'] * len(D_ACTIONS)).format(
-        *flatten(zip((stats.get('rating', '') for site, stats in d_stats.items()
-                      if site in D_ACTIONS.keys()), # ratings sites only
+    reviewtxt = '{sep}'.join(['{:^{}}'] * len(SITES)).format(
+        *flatten(zip((format_rating(stats.get('rating', '…' if stats.get('pending') else ''))
+                      for stats in (d_stats.get(site) or {} for site in SITES)), # ratings sites only
                      widths)), sep=sep)
     # reviewtxt = '{sep}'.join(['{:^{}}'] * len(d_reviews)).format(
     #     *flatten(zip(d_reviews.values(), widths)), sep=SEP)
@@ -142,22 +472,6 @@ def print_fancy(beer, d_stats, sep='|', spacer='  ', **kwargs):
     print()
 
 
-def get_info_ranked(d_stats, k_info, l_ranked_ks=['untappd', 'beermenus',
-                                                  'ratebeer', 'beeradvocate']):
-    """
-    dict of beer stats, key for info, list of ranked keys -> info under highest ranked key available
-       i.e. d_stats[highest_ranked_k_in_l][k_info]
-    """
-    if not l_ranked_ks: # base case: info not found in any of ranked keys
-        return ''
-
-    top_k, *rest = l_ranked_ks
-    try:
-        return d_stats[top_k][k_info]
-    except(KeyError):
-        return get_info_ranked(d_stats, k_info, rest)
-
-
 def get_info_consensus(d_stats, k_info):
     """
     dict of beer stats, key for info -> consensus info under key across sites
@@ -170,56 +484,71 @@ def get_info_consensus(d_stats, k_info):
 
 
 def print_simple(beer, d_stats, maxwidth, maxstylewidth, sep='|', spacer=' ',
-                 terse=True, **kwargs):
+                 terse=True, marker='', **kwargs):
+
+    print(format_simple(beer, d_stats, maxwidth, sites=SITES, sep=sep,
+                        spacer=spacer, terse=terse, marker=marker))
+
+
+def split_menu(barname, d_beermenus):
+    """
+    barname, {beername: beermenus stats} -> (lst of beers on tap, lst of cans & bottles)
+    """
+    def is_served_as(beer, *args):
+        servingtypes = {d['type'].lower() for d in d_beermenus[beer]['serving']}
+        return any(arg in servingtypes for arg in args)
 
-    reviewtxt = '{sep}'.join(['{:^6}'] * len(D_ACTIONS)).format(
-        *(stats.get('rating', '') for site, stats in d_stats.items()
-          if site in D_ACTIONS.keys()), # rating sites only
-        sep=sep)
+    is_on_tap = lambda beer: is_served_as(beer, 'draft', 'cask', 'crowler', 'growler')
+    is_bottled = lambda beer: is_served_as(beer, 'bottle', 'can')
 
-    style = get_info_ranked(d_stats, 'style').lower()
-    abv   = get_info_ranked(d_stats, 'abv')
+    has_no_servinginfo = lambda beer: not d_beermenus[beer]['serving']
 
-    if terse:
-        style = re.sub(' -.*$', '', style)
+    beerlst = [beer for beer in d_beermenus.keys() if (is_on_tap(beer) or
+                                                       has_no_servinginfo(beer))]
+    beerlst_rest = [beer for beer in d_beermenus.keys() if is_bottled(beer)]
 
-    print('[{}]{spacer}{:<{width}}{spacer}({} · {})'.format(reviewtxt,
-    #print('[{}]{spacer}{:<{width}}{spacer}({:<{stylewidth}} · {:>3})'.format(reviewtxt,
-                                                            beer,
-                                                            style,
-                                                            abv,
-                                                            width=maxwidth,
-                                                            #stylewidth=maxstylewidth,
-                                                            spacer=spacer))
+    if barname.lower() == 'covenhoven': # TODO drafts listed as bottle - eventually fix for good
+        beerlst = list(d_beermenus.keys())
+        beerlst_rest = []
+
+    return beerlst, beerlst_rest
+
+
+def lazy_stats(beer, site, stats, fields=TEXT_FIELDS, offline=False):
+    """
+    beer, site, Stats (as looked up w fields) -> LazyStats, w site's other fields fetched on first access
+    """
+    if not isinstance(stats, Stats): # e.g. engine.PENDING, or --diff state (as stored)
+        stats = Stats.from_dict(stats or {})
+
+    unfetched = [k for k in REGISTRY[site].fields if k not in fields]
+    return LazyStats.from_stats(stats, unfetched=unfetched,
+                                fetch=partial(get_site_stats, beer, site, offline=offline,
+                                              fields=REGISTRY[site].fields))
+
+
+def is_fresh(d_stats, stamp):
+    """
+    sitesdict of statsdicts (stored for --diff), when looked up -> still within every site's review TTL ?
+    """
+    age = time.time() - stamp
+    return all(age < REGISTRY[site].ttl for site in d_stats if site in REGISTRY)
 
 
 @fail_gracefully
 def outer_main(barquery=None, beerfile=None, get_taps=True, get_cans=False,
-               interactive=False, **kwargs):
+               interactive=False, diff=False, **kwargs):
 
     if barquery:
-        barname, bar_url = get_bar(barquery)
+        refresh, offline = kwargs.get('refresh', False), kwargs.get('offline', False)
+
+        barname, bar_url = get_bar_cached(barquery, refresh=refresh)
         # beerlst, n_on_tap = get_beers(bar_url)
         # d_beers_beermenus, n_on_tap = get_beers(bar_url)
-        d_beermenus = get_beers(bar_url)
+        d_beermenus = get_beers_cached(bar_url, refresh=refresh, offline=offline)
         kwargs['d_beermenus'] = d_beermenus
 
-        def is_served_as(beer, *args):
-            servingtypes = {d['type'].lower() for d in d_beermenus[beer]['serving']}
-            return any(arg in servingtypes for arg in args)
-
-        is_on_tap = lambda beer: is_served_as(beer, 'draft', 'cask', 'crowler', 'growler')
-        is_bottled = lambda beer: is_served_as(beer, 'bottle', 'can')
-
-        has_no_servinginfo = lambda beer: not d_beermenus[beer]['serving']
-
-        beerlst = [beer for beer in d_beermenus.keys() if (is_on_tap(beer) or
-                                                           has_no_servinginfo(beer))]
-        beerlst_rest = [beer for beer in d_beermenus.keys() if is_bottled(beer)]
-
-        if barname.lower() == 'covenhoven': # TODO drafts listed as bottle - eventually fix for good
-            beerlst = list(d_beermenus.keys())
-            beerlst_rest = []
+        beerlst, beerlst_rest = split_menu(barname, d_beermenus)
 
     else:
         barname = beerfile.split('_')[-1]
@@ -229,115 +558,356 @@ def outer_main(barquery=None, beerfile=None, get_taps=True, get_cans=False,
 
     print('\n what\'s on @ {} ?? \n'.format(barname.upper()))
 
+    if barquery and diff: # reuse last run's results for beers still on the menu
+        state = get_cache().get(bar_url, STATE, ttl=float('inf'))
+        d_stamps = {}
+
+        if state is not None:
+            added, removed, changed = diff_menus(state['beermenus'], d_beermenus)
+
+            # (but not if refreshing, or once any site's reviews would've gone stale in the review cache)
+            d_stamps = state.get('stamps', {}) # beer -> when looked up (none = from before stamps)
+            kwargs['d_beers_known'] = {
+                beer: d_stats for beer, d_stats in state['beers'].items()
+                if beer in d_beermenus and not refresh and
+                is_fresh(d_stats, d_stamps.get(beer, 0))}
+            kwargs['new_beers'] = added
+
+            print('{} new · {} gone · {} changed\n'.format(len(added), len(removed),
+                                                           len(changed)))
+            if removed:
+                print('gone: {}\n'.format(', '.join(sorted(removed))))
+
+    d_beers1, d_beers2 = {}, {}
+
     if beerfile or (barquery and get_taps):
         # beerlst_taps = beerlst[:n_on_tap]
         beerlst_taps = beerlst
-        d_beers1 = alternate_main(beerlst_taps, with_key=(not get_cans), **kwargs)
+        d_beers1 = alternate_main(beerlst_taps, with_key=(not get_cans), barname=barname,
+                                  **kwargs)
 
     if barquery and get_cans:
         print('\nCANS & BOTTLES...\n')
         # beerlst_cans = beerlst[n_on_tap:]
         beerlst_cans = beerlst_rest
-        d_beers2 = alternate_main(beerlst_cans, with_key=get_cans, **kwargs)
-
-    if interactive:
-        from itertools import chain
+        d_beers2 = alternate_main(beerlst_cans, with_key=get_cans, barname=barname,
+                                  **kwargs)
+
+    if barquery and diff:
+        d_beers = {beer: {site: as_dict(stats) for site, stats in d_stats.items()
+                          if site != 'beermenus'}
+                   for beer, d_stats in chain(d_beers1.items(), d_beers2.items())
+                   if not any(stats.get('pending') for stats in d_stats.values())} # retry timeouts
+        d_stamps = {beer: (d_stamps.get(beer, 0) if beer in kwargs.get('d_beers_known', {})
+                           else time.time()) # reused results keep when they were looked up
+                    for beer in d_beers}
+        get_cache().put(bar_url, STATE, {'beermenus': d_beermenus, 'beers': d_beers,
+                                         'stamps': d_stamps})
+
+    if interactive: # w anything the run skipped (e.g. descriptions) looked up as it's looked at
         for k, v in chain(d_beers1.items(), d_beers2.items()):
-            d_beers = d_beermenus[k].update(**v)
+            d_beermenus.setdefault(k, {}).update(**{
+                site: (lazy_stats(k, site, stats, offline=kwargs.get('offline', False))
+                       if site in SITES else stats)
+                for site, stats in v.items() if site != 'beermenus'})
 
         import IPython; IPython.embed()
 
 
-def word_intersection(*args):
+@fail_gracefully
+def multi_main(barqueries, get_taps=True, get_cans=False, nthreads=4, top=10,
+               writer=None, **kwargs):
     """
-    strs / lists -> word intersection
+    many bars -> per-bar report + combined ranking, w each distinct beer looked up once
+
+    :writer: output.Writer, to stream a row per (bar, beer) as each beer lands instead
     """
-    args = ((arg.lower().split() if isinstance(arg, str) # str -> list
-             else (a.lower() for a in arg)) # lst -> lowerlst
-            for arg in args)
-    return set.intersection(*(set(arg) for arg in args))
+    from concurrent.futures import ThreadPoolExecutor
 
+    refresh, offline = kwargs.get('refresh', False), kwargs.get('offline', False)
 
-def alternate_main(beerlst, d_beermenus={}, fancy=False, sorted_=False,
-                   sort_by=None, filter_by=[], nthreads=1, verbose=False,
-                   with_key=False):
+    def get_menu(barquery):
+        try:
+            barname, bar_url = get_bar_cached(barquery, refresh=refresh)
+            return barname, get_beers_cached(bar_url, refresh=refresh, offline=offline)
+        except(SystemExit, Exception): # (get_bar exits if not found) -> just this bar skipped
+            print('couldn\'t find {}, skipping...\n'.format(barquery))
+            return None
+
+    # menus, concurrently
+    with ThreadPoolExecutor(max(len(barqueries), 1)) as pool:
+        menus = [menu for menu in pool.map(get_menu, barqueries) if menu is not None]
+
+    beerlsts = []
+    d_menustats = {} # canonical beer -> beermenus stats
+    for barname, d_beermenus in menus:
+        d_menustats.update((canonicalize(beer), stats) for beer, stats in d_beermenus.items())
+
+        beerlst_taps, beerlst_cans = split_menu(barname, d_beermenus)
+        beerlsts.append((beerlst_taps if get_taps else []) +
+                        (beerlst_cans if get_cans else []))
+
+    # dedupe across bars (incl near-duplicate spellings)
+    d_unique = {}
+    for beer in chain.from_iterable(beerlsts):
+        d_unique.setdefault(canonicalize(beer), beer)
+
+    print('\n {} bars · {} distinct beers \n'.format(len(menus), len(d_unique)))
+
+    fetch_kwargs = {k: v for k, v in kwargs.items()
+                    if k in ('verbose', 'refresh', 'offline', 'engine', 'deadline', 'hedge')}
+    fetch_kwargs['fields'] = SITE_FIELDS if writer is not None else TEXT_FIELDS
+    fetch_kwargs['site_timeouts'] = dict.fromkeys(SITES, kwargs.get('site_timeout'))
+
+    from ranking import Table, is_kept
+
+    filters = dict(filter_by=kwargs.get('filter_by', []), min_rating=kwargs.get('min_rating'),
+                   min_abv=kwargs.get('min_abv'))
+
+    if writer is not None: # rows as they land, for all bars serving each beer
+        d_servings = defaultdict(list) # canonical beer -> [(barname, beer, beermenus stats)]
+        for (barname, d_beermenus), beerlst in zip(menus, beerlsts):
+            for beer in beerlst:
+                d_servings[canonicalize(beer)].append((barname, beer, d_beermenus[beer]))
+
+        for beer, d_stats in iter_beer_dict(list(d_unique.values()), nthreads=nthreads,
+                                            **fetch_kwargs):
+            for barname, beer_at_bar, d_menu in d_servings[canonicalize(beer)]:
+                d_stats_at_bar = dict(d_stats, beermenus=d_menu)
+
+                if is_kept(d_stats_at_bar, **filters):
+                    writer.write(barname, beer_at_bar, d_stats_at_bar)
+        return
+
+    d_results = populate_beer_dict(list(d_unique.values()), nthreads=nthreads,
+                                   **fetch_kwargs)
+    get_result = lambda beer: d_results[d_unique[canonicalize(beer)]]
+
+    # per bar
+    d_bars = defaultdict(list) # canonical beer -> bars
+    for (barname, d_beermenus), beerlst in zip(menus, beerlsts):
+        print('\n what\'s on @ {} ?? \n'.format(barname.upper()))
+
+        if not beerlst:
+            print('nothing..\n')
+            continue
 
-    d_beers = populate_beer_dict(beerlst, nthreads=nthreads, verbose=verbose)
-    print() # space after progress bar
+        for beer in beerlst:
+            d_bars[canonicalize(beer)].append(barname)
+
+        alternate_main(beerlst, d_beermenus=d_beermenus, nthreads=nthreads,
+                       d_beers_known={beer: get_result(beer) for beer in beerlst},
+                       exit_if_empty=False, **kwargs)
+
+    # across bars
+    d_keys = {beer: k for k, beer in d_unique.items()}
+    table = Table.from_dicts(list(d_keys), {beer: dict(d_results[beer],
+                                                       beermenus=d_menustats.get(k, {}))
+                                            for beer, k in d_keys.items()})
+    d_avgs = dict(zip(table.beers, table.consensus()))
+
+    ranked = table.rank(mask=table.mask(**filters))[:top]
+
+    print('\n best pour nearby \n')
+    maxwidth = max((len(beer) for beer in ranked), default=0)
+    for beer in ranked:
+        avg = d_avgs[beer]
+        print('[{:^6}]  {:<{width}}  @ {}'.format('{:.2f}'.format(avg) if avg >= 0 else '',
+                                                  beer, ', '.join(d_bars[d_keys[beer]]),
+                                                  width=maxwidth))
+    print()
 
-    # augment with beermenus data
-    for beer in beerlst:
-        d_beers[beer]['beermenus'] = d_beermenus.get(beer, {})
 
-    # filter
-    #get_style = lambda x: d_beers[x]['untappd']['style']
-    get_style = lambda x: [d.get('style', '') for d in
-                           d_beers[x].values()]
-
-    beerlst = ([beer for beer in beerlst if word_intersection(get_style(beer),
-                                                              filter_by)]
-               if filter_by else beerlst)
-    if not beerlst:
-        print('overly filtered beers\n')
-        sys.exit(0)
+class LiveView(object):
+    """
+    redraw block of printed lines in place (on a terminal)
 
-    # sort
-    beerlst = (sort_beerlst(beerlst, d_beers, sorted_=sorted_, sort_by=sort_by)
-               if (sorted_ or sort_by) else beerlst)
+    frames are cut to fit the terminal (the cursor can't back up past its top, so taller ones would leave
+    stale copies in scrollback), except for the final one, which is printed in full
+    """
+
+    def __init__(self, stream=sys.stdout, min_interval=0.1):
+        self.stream = stream
+        self.min_interval = min_interval # s between redraws
+
+        self.n_lines = 0
+        self.last = 0
+
+    def clip(self, txt):
+        """
+        txt -> txt cut to terminal height (less a line for the cursor)
+        """
+        from shutil import get_terminal_size
+
+        lines = txt.splitlines(keepends=True)
+        height = max(get_terminal_size().lines - 1, 2)
+
+        if len(lines) <= height:
+            return txt
+        return ''.join(lines[:height - 1]) + '... {} more\n'.format(len(lines) - height + 1)
+
+    def draw(self, txt, force=False, final=False):
+        now = time.time()
+        if not (force or final) and now - self.last < self.min_interval:
+            return
+
+        if self.n_lines: # back up & clear previous frame
+            self.stream.write('\x1b[{}F\x1b[J'.format(self.n_lines))
+
+        if not final:
+            txt = self.clip(txt)
+        self.stream.write(txt)
+        self.stream.flush()
+
+        self.n_lines = txt.count('\n')
+        self.last = now
+
+
+def alternate_main(beerlst, d_beermenus={}, fancy=False, sorted_=False,
+                   sort_by=None, filter_by=[], nthreads=1, verbose=False,
+                   refresh=False, offline=False, engine='async', with_key=False,
+                   d_beers_known={}, new_beers=(), exit_if_empty=True,
+                   deadline=None, site_timeout=None, hedge=False, writer=None,
+                   barname='', min_rating=None, min_abv=None):
+    """
+    :d_beers_known: {beer: sitesdict of statsdicts} already looked up (e.g. last run), so not refetched
+    :new_beers: beers to mark as new
+    :writer: output.Writer, to stream rows (in order of completion) rather than print
+    :barname: for rows
+    :min_rating: / :min_abv: drop beers below (or w none found)
+    """
+
+    from contextlib import redirect_stdout
+    from io import StringIO
+
+    from tqdm import tqdm
 
-    # print
-    MAXWIDTH = max((len(beer) for beer in beerlst))
-    MAXSTYLEWIDTH = max((len(get_style(beer)) for beer in beerlst))
     SPACER = '  '
     SEP = '|'
 
+    # print
     kwargs = dict(
         spacer = SPACER,
         sep = SEP,
-        maxwidth = MAXWIDTH,
-        maxstylewidth = MAXSTYLEWIDTH
+        maxwidth = max((len(beer) for beer in beerlst), default=0),
+        maxstylewidth = max((len(d_beermenus.get(beer, {}).get('style', ''))
+                             for beer in beerlst), default=0)
     )
     pprint = print_fancy if fancy else print_simple
 
-    for beer in beerlst:
+    # filter
+    from ranking import is_kept as is_kept_
 
-        d_stats = d_beers[beer]
+    is_kept = lambda d_stats: is_kept_(d_stats, filter_by=filter_by, min_rating=min_rating,
+                                       min_abv=min_abv)
 
+    def pprint_or_skip(beer, d_stats):
         # shld only happen with non-beermenus beer (i.e. from file)
         if not any(v for v in d_stats.values()): # no data found
             print('\nskipping {}...\n'.format(beer))
+        else:
+            marker = ('' if not new_beers else
+                      '+ ' if beer in new_beers else '  ')
+            pprint(beer, d_stats, marker=marker, **kwargs)
+
+    ranked = (sorted_ or sort_by) and writer is None
+    live = ranked and sys.stdout.isatty()
+
+    # ranked view is redrawn as ratings land, so no need for progress bar too
+    beerlst_known = [beer for beer in beerlst if beer in d_beers_known]
+    beerlst_tofetch = [beer for beer in beerlst if beer not in d_beers_known]
+
+    results = chain(((beer, dict(d_beers_known[beer])) for beer in beerlst_known),
+                    iter_beer_dict(beerlst_tofetch, nthreads=nthreads, verbose=verbose,
+                                   refresh=refresh, offline=offline, engine=engine,
+                                   progress=(not live), deadline=deadline,
+                                   site_timeouts=dict.fromkeys(SITES, site_timeout),
+                                   hedge=hedge,
+                                   fields=(SITE_FIELDS if writer is not None else TEXT_FIELDS)))
+    if not live:
+        print() # space after progress bar
+
+    view = LiveView()
+
+    def render(d_beers, beerlst_kept):
+        txt = StringIO()
+        with redirect_stdout(txt):
+            for beer in sort_beerlst(beerlst_kept, d_beers, sorted_=sorted_,
+                                     sort_by=sort_by):
+                pprint_or_skip(beer, d_beers[beer])
+        return txt.getvalue()
+
+    d_beers = {}
+    beerlst_kept = []
+
+    for beer, d_stats in results: # as they land
+        # augment with beermenus data
+        d_stats['beermenus'] = d_beermenus.get(beer, {})
+        d_beers[beer] = d_stats
+
+        if not is_kept(d_stats):
             continue
+        beerlst_kept.append(beer)
+
+        if writer is not None:
+            writer.write(barname, beer, d_stats)
+        elif not ranked: # stream
+            with tqdm.external_write_mode(): # print above progress bar
+                pprint_or_skip(beer, d_stats)
+        elif live:
+            view.draw(render(d_beers, beerlst_kept))
+
+    if not beerlst_kept:
+        print('overly filtered beers\n')
+        if exit_if_empty:
+            sys.exit(0)
+        return {}
+
+    if ranked: # final ranking
+        txt = render(d_beers, beerlst_kept)
+        if live:
+            view.draw(txt, final=True)
+        else:
+            print(txt, end='')
 
-        # take consensus
-        # d_stats_consensus = defaultdict(lambda: [])
-        # d_stats_squashed = {defaultdict(lambda: [])}
+    if with_key and not fancy and writer is None: # print key
+        print('\n{}\n'.format(format_key(SITES, sep=SEP, spacer=SPACER)))
 
-        pprint(beer, d_stats, **kwargs)
+    return {beer: d_beers[beer] for beer in beerlst if beer in d_beers}
 
-    if with_key and not fancy: # print key
-        sites = D_ACTIONS.keys()
-        maxsitewidth = max((len(site) for site in sites))
-        sitetxt = '{sep}'.join(['{:^{width}}'] * len(sites)).format(*sites,
-                                                                    sep=SEP,
-                                                                    width=maxsitewidth + 2)
-        print('\n[{}]{spacer}=={spacer}key\n'.format(sitetxt, spacer=SPACER))
 
-    return d_beers
+def report_profile(show=True, path=None, stream=None):
+    import profiling
+
+    if show:
+        print('\n' + profiling.summary() + '\n', file=(stream or sys.stdout))
+
+    if path:
+        (profiling.export_trace if path.endswith('.trace.json') else
+         profiling.export_json)(path)
 
 
 def get_parser():
 
     parser = argparse.ArgumentParser(description=(''))
     parser.add_argument('bar', nargs='*')
+    parser.add_argument('-b', '--bars', nargs='*', default=[],
+                        help='many bars (quote multi-word names), for combined report')
+    parser.add_argument('--bars-file', default=None,
+                        help='path/to/file of bars, 1 per line, for combined report')
     parser.add_argument('-f', nargs='*', default=[],
                         help='path/to/beerfile')
     parser.add_argument('--sorted', action='store_true',
                         help='sort by average rating? (default: false)')
     parser.add_argument('--sort-by', default=None,
-                        choices=D_ACTIONS.keys(),
+                        choices=SITES,
                         help='ratings website to sort by? (default: none)')
     parser.add_argument('--filter-by', nargs='*', default=[],
                         help='style/s to filter by? (default: all styles)')
+    parser.add_argument('--min-rating', type=float, default=None,
+                        help='minimum avg rating, w unrated beers dropped (default: none)')
+    parser.add_argument('--min-abv', type=float, default=None,
+                        help='minimum abv, in %%, w unknown dropped (default: none)')
     parser.add_argument('-a', '--all', action='store_true',
                         help='taps AND cans & bottles ? (default: taps only)')
     parser.add_argument('--just-cans', action='store_true',
@@ -345,39 +915,171 @@ def get_parser():
     parser.add_argument('--fancy', action='store_true',
                         help='~*~print fancy~*~ (default: false)')
     parser.add_argument('-t', '--nthreads', type=int, default=4,
-                        help='number of threads (default: 4)')
+                        help='number of threads, i.e. concurrent requests per site (default: 4)')
+    parser.add_argument('--engine', default='async', choices=('async', 'pool'),
+                        help='concurrent requests, or multiprocessing pool? (default: async)')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='time budget for all lookups, in s, after which missing ratings show as … (async engine) (default: none)')
+    parser.add_argument('--site-timeout', type=float, default=None,
+                        help='soft timeout per site lookup, in s (default: none)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='send duplicate request when a lookup runs slower than usual? (default: false)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='per-request timeout, in s (default: 15)')
+    parser.add_argument('--retries', type=int, default=None,
+                        help='retries per failed request (default: 2)')
+    parser.add_argument('--rates', default=None,
+                        help='per-site request limits, as "domain=req/s[:burst[:max req/s]],..." (default: built-in)')
+    parser.add_argument('--http2', action='store_true',
+                        help='use HTTP/2, if httpx[http2] installed? (default: false)')
+    parser.add_argument('--stream', action='store_true',
+                        help='beerfile: read, look up & write beers as they go, in flat memory (e.g. for huge files)? (default: false)')
+    parser.add_argument('--resume', action='store_true',
+                        help='pick up interrupted --stream run of beerfile where it left off (appending to -o)? (default: false)')
+    parser.add_argument('--diff', action='store_true',
+                        help='only look up beers new since last --diff run of this bar? (default: false)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='ignore cached reviews & re-scrape? (default: false)')
+    parser.add_argument('--offline', action='store_true',
+                        help='cached bars, menus & reviews where available, no review scraping? (default: false)')
+    parser.add_argument('--format', default='text', choices=FORMATS,
+                        help='output format, streamed as beers land (default: text)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='path/to/save output (default: stdout, w text to stderr)')
     parser.add_argument('--interactive', action='store_true',
                         help='start IPython interactive session (e.g. to get more beer info)? (default: false)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print per-stage & per-site timing summary? (default: false)')
+    parser.add_argument('--profile-out', default=None,
+                        help='path/to/save profile stats, as json (or chrome trace, if *.trace.json)')
     parser.add_argument('--verbose', action='store_true',
                         help='verbose printing (e.g. for debugging)? (default: false)')
-    # parser.add_argument('--filter-by', type=float, default=0,
-    #                     help='minimum rating threshold (default: 0)')
     return parser
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']: # daemon
+        import server
+        server.main(sys.argv[2:])
+        sys.exit(0)
+
+    if sys.argv[1:2] == ['prefetch']: # watchlist
+        import prefetch
+        prefetch.main(sys.argv[2:])
+        sys.exit(0)
+
     # parse args
     args = get_parser().parse_args()
 
     try:
-        assert args.bar or args.f, 'must supply bar or path/to/beerfile.. u drinking already ?'
+        assert args.bar or args.f or args.bars or args.bars_file, 'must supply bar or path/to/beerfile.. u drinking already ?'
     except(AssertionError) as e:
         exit_txt, = e.args
         print(exit_txt)
         sys.exit(0)
 
+    if args.resume:
+        args.stream = True
+    if args.stream:
+        if not args.f or args.sorted or args.sort_by:
+            print('--stream is for beerfiles (-f), & writes beers as they land (so can\'t sort)')
+            sys.exit(0)
+        args.engine = 'async' # (bounded window)
+    if args.engine == 'pool' and is_timed(args.deadline, dict.fromkeys(SITES, args.site_timeout),
+                                                  args.hedge):
+        print('--deadline, --site-timeout & --hedge need the async engine')
+        sys.exit(0)
+
+    import profiling, ratelimit, sessions
+    if args.profile or args.profile_out:
+        profiling.enable()
+
+        import atexit
+        atexit.register(report_profile, args.profile, args.profile_out,
+                        stream=(sys.stderr if args.format != 'text' else None)) # keep stdout for rows
+
+    sessions.configure(timeout=args.timeout, retries=args.retries, http2=args.http2)
+    ratelimit.configure(rates=args.rates,
+                        share=(args.nthreads if args.engine == 'pool' else None))
+
     barquery = ' '.join(args.bar)
     beerfile = '\ '.join(args.f) # escape spaces
 
-    # alternate_main(barquery=barquery,
-    outer_main(barquery=barquery,
-               beerfile=beerfile,
-               fancy=args.fancy,
-               sorted_=args.sorted,
-               sort_by=args.sort_by,
-               filter_by=args.filter_by,
-               nthreads=args.nthreads,
-               interactive=args.interactive,
-               verbose=args.verbose,
-               get_taps=(not args.just_cans),
-               get_cans=(args.all or args.just_cans))
+    from contextlib import ExitStack, redirect_stdout
+
+    with ExitStack() as stack:
+        writer = None
+        if args.format != 'text': # rows -> stdout (or file), & everything else -> stderr
+            import os
+            append = args.resume and args.output and os.path.exists(args.output) # (continued)
+
+            f = (stack.enter_context(open(args.output, 'wb') if args.format == 'parquet' else
+                                     open(args.output, 'a' if append else 'w', newline=''))
+                 if args.output else sys.stdout)
+            writer = stack.enter_context(get_writer(args.format, f, sites=SITES,
+                                                    append=append))
+            stack.enter_context(redirect_stdout(sys.stderr))
+
+        if args.stream:
+            import stream
+            stream.stream_main(' '.join(args.f),
+                               resume=args.resume,
+                               writer=writer,
+                               fancy=args.fancy,
+                               filter_by=args.filter_by,
+                               min_rating=args.min_rating,
+                               min_abv=args.min_abv,
+                               nthreads=args.nthreads,
+                               deadline=args.deadline,
+                               site_timeout=args.site_timeout,
+                               hedge=args.hedge,
+                               refresh=args.refresh,
+                               offline=args.offline,
+                               verbose=args.verbose)
+
+        elif args.bars or args.bars_file:
+            barqueries = args.bars + (get_from_file(f=args.bars_file) if args.bars_file else [])
+            barqueries += [barquery] if barquery else []
+
+            multi_main(barqueries,
+                       fancy=args.fancy,
+                       sorted_=args.sorted,
+                       sort_by=args.sort_by,
+                       filter_by=args.filter_by,
+                       min_rating=args.min_rating,
+                       min_abv=args.min_abv,
+                       nthreads=args.nthreads,
+                       engine=args.engine,
+                       deadline=args.deadline,
+                       site_timeout=args.site_timeout,
+                       hedge=args.hedge,
+                       refresh=args.refresh,
+                       offline=args.offline,
+                       verbose=args.verbose,
+                       writer=writer,
+                       get_taps=(not args.just_cans),
+                       get_cans=(args.all or args.just_cans))
+
+        else:
+            # alternate_main(barquery=barquery,
+            outer_main(barquery=barquery,
+                       beerfile=beerfile,
+                       fancy=args.fancy,
+                       sorted_=args.sorted,
+                       sort_by=args.sort_by,
+                       filter_by=args.filter_by,
+                       min_rating=args.min_rating,
+                       min_abv=args.min_abv,
+                       nthreads=args.nthreads,
+                       engine=args.engine,
+                       deadline=args.deadline,
+                       site_timeout=args.site_timeout,
+                       hedge=args.hedge,
+                       diff=args.diff,
+                       refresh=args.refresh,
+                       offline=args.offline,
+                       interactive=args.interactive,
+                       verbose=args.verbose,
+                       writer=writer,
+                       get_taps=(not args.just_cans),
+                       get_cans=(args.all or args.just_cans))
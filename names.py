@@ -0,0 +1,229 @@
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+from math import ceil
+import re
+import threading
+
+from cache import CACHE_PATH, SqliteStore, normalize
+
+
+THRESHOLD = 0.8 # min trigram jaccard similarity to count as same beer
+MIN_WORD_SIMILARITY = 0.8 # .. & of the one word allowed to differ (i.e. misspelt)
+MAX_MEMO = 10000 # names remembered in memory (most recently used), so --stream over huge files stays flat
+
+VINTAGE = re.compile(r'\b(?:(?:19|20)\d\d|vintage)\b')
+NUMBER = re.compile(r'\d+')
+
+# (name, name, same beer?) .. run `python names.py` to check
+EXAMPLES = (
+    ("Edmund's Oast Viridi Rex", 'Edmunds Oast Viridi Rex', True),
+    ('Schneider Weisse Tap 5', 'Schneider Weisse Tap 6', False),
+    ('Schneider Weisse Tap 5', 'Schneider Weisse Tap 7', False),
+    ('Trappistes Rochefort 10', 'Trappistes Rochefort 8', False),
+    ('Weihenstephaner Hefeweissbier', 'Weihenstephaner Hefeweisbier', True),
+    ('Founders Kentucky Breakfast Stout', 'Founders Kentucky Breakfest Stout', True),
+    ('Goose Island Bourbon County Coffee Stout', 'Goose Island Bourbon County Stout', False),
+    ('Sierra Nevada Pale Ale Hazy', 'Sierra Nevada Pale Ale', False),
+)
+
+
+def clean(beername):
+    """
+    beername -> matching key, i.e. normalized w/o apostrophes, punctuation, or vintage
+    """
+    beername = normalize(beername)
+    beername = re.sub(r"['’`]", '', beername)   # edmund's -> edmunds
+    beername = re.sub(r'[^\w\s]', ' ', beername) # punctuation -> space
+    beername = VINTAGE.sub(' ', beername)        # 2019 / vintage
+    return ' '.join(beername.split())
+
+
+def trigrams(key):
+    """
+    matching key -> set of character trigrams (padded, so short names still have some)
+    """
+    key = ' {} '.format(key)
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if (a or b) else 0
+
+
+def numbers(key):
+    """
+    matching key -> sorted numbers in it, e.g. "tap 6" -> ["6"] (which must match exactly, since trigrams
+                    barely tell "tap 6" from "tap 7")
+    """
+    return sorted(NUMBER.findall(key))
+
+
+def same_words(a, b):
+    """
+    matching keys -> same words, but for at most 1 misspelt ? (an added word, e.g. "bourbon county [coffee] stout",
+                     is a different beer, though trigrams barely tell)
+    """
+    a_only = Counter(a.split()) - Counter(b.split())
+    b_only = Counter(b.split()) - Counter(a.split())
+
+    if not a_only and not b_only:
+        return True
+    if sum(a_only.values()) != 1 or sum(b_only.values()) != 1:
+        return False
+
+    (word_a,), (word_b,) = a_only, b_only
+    return SequenceMatcher(None, word_a, word_b).ratio() >= MIN_WORD_SIMILARITY
+
+
+class BeerIndex(SqliteStore):
+    """
+    index of known beers: beername -> canonical name (first spelling seen), matching near-duplicates
+
+    candidates come from posting lists of each query's rarest trigrams only (prefix filtering),
+    so lookups stay sublinear as the index grows
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS beers ('
+        'id INTEGER PRIMARY KEY, '
+        'key TEXT UNIQUE NOT NULL, '
+        'name TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS grams ('
+        'gram TEXT NOT NULL, '
+        'id INTEGER NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS grams_gram ON grams (gram)',
+        'CREATE TABLE IF NOT EXISTS gramfreqs ('
+        'gram TEXT PRIMARY KEY, '
+        'n INTEGER NOT NULL)'
+    )
+
+    def __init__(self, path=CACHE_PATH, threshold=THRESHOLD, max_memo=MAX_MEMO):
+        super().__init__(path)
+
+        self.threshold = threshold
+        self.max_memo = max_memo
+
+        self._memo = OrderedDict() # beername -> canonical name
+        self._memo_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def lookup(self, beername):
+        """
+        beername -> (id, canonical name) of best match above threshold, or None
+        """
+        key = clean(beername)
+
+        row = self.conn.execute('SELECT id, name FROM beers WHERE key = ?', (key,)).fetchone()
+        if row is not None: # exact
+            return row
+
+        grams = trigrams(key)
+        if not grams:
+            return None
+
+        # rarest first
+        qmarks = ','.join('?' * len(grams))
+        d_freqs = dict(self.conn.execute('SELECT gram, n FROM gramfreqs WHERE gram IN ({})'.format(qmarks),
+                                         tuple(grams)).fetchall())
+        ordered = sorted(grams, key=lambda gram: (d_freqs.get(gram, 0), gram))
+
+        # any match above threshold must share >= 1 of these
+        prefix = ordered[:len(grams) - ceil(self.threshold * len(grams)) + 1]
+        prefix = [gram for gram in prefix if gram in d_freqs]
+        if not prefix:
+            return None
+
+        candidates = self.conn.execute(
+            'SELECT beers.id, beers.key, beers.name FROM beers WHERE id IN ('
+            'SELECT DISTINCT id FROM grams WHERE gram IN ({}))'.format(','.join('?' * len(prefix))),
+            tuple(prefix)).fetchall()
+
+        scored = [(jaccard(grams, trigrams(k)), id_, name) for id_, k, name in candidates
+                  if numbers(k) == numbers(key) and same_words(k, key)]
+        score, id_, name = max(scored, default=(0, None, None))
+
+        return (id_, name) if score >= self.threshold else None
+
+    def add(self, beername):
+        """
+        beername -> (id, canonical name), adding as new canonical beer if not already indexed
+        """
+        key = clean(beername)
+        grams = trigrams(key)
+
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self.conn.execute('INSERT OR IGNORE INTO beers (key, name) VALUES (?, ?)',
+                                           (key, beername))
+                if cursor.rowcount: # i.e. new
+                    id_ = cursor.lastrowid
+                    self.conn.executemany('INSERT INTO grams VALUES (?, ?)',
+                                          ((gram, id_) for gram in grams))
+                    self.conn.executemany('INSERT INTO gramfreqs VALUES (?, 1) '
+                                          'ON CONFLICT (gram) DO UPDATE SET n = n + 1',
+                                          ((gram,) for gram in grams))
+                self.conn.execute('COMMIT')
+            except:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        return self.conn.execute('SELECT id, name FROM beers WHERE key = ?', (key,)).fetchone()
+
+    def canonicalize(self, beername):
+        """
+        beername -> canonical name of matching known beer (indexing it if new)
+        """
+        with self._memo_lock:
+            canonical = self._memo.get(beername)
+            if canonical is not None:
+                self._memo.move_to_end(beername)
+                return canonical
+
+        _, canonical = self.lookup(beername) or self.add(beername)
+
+        with self._memo_lock:
+            self._memo[beername] = canonical
+            while len(self._memo) > self.max_memo:
+                self._memo.popitem(last=False)
+        return canonical
+
+
+_INDEX = None
+
+def get_index():
+    """
+    -> module-level beer index (lazily created)
+    """
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = BeerIndex()
+    return _INDEX
+
+
+def canonicalize(beername):
+    return get_index().canonicalize(beername)
+
+
+def check(examples=EXAMPLES):
+    """
+    -> lst of examples matched wrongly (str), each checked against a scratch index
+    """
+    import os
+    import tempfile
+
+    wrong = []
+    for a, b, same in examples:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = BeerIndex(os.path.join(tmp, 'names.sqlite'))
+            if (index.canonicalize(b) == index.canonicalize(a)) != same:
+                wrong.append('{!r} {} {!r}'.format(a, '!=' if same else '==', b))
+    return wrong
+
+
+if __name__ == '__main__':
+    import sys
+
+    wrong = check()
+    for example in wrong:
+        print('WRONG {}'.format(example))
+    sys.exit(1 if wrong else 0)
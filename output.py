@@ -0,0 +1,250 @@
+import csv
+import json
+import re
+import sys
+
+from sites import INFO_RANKING, SITES
+
+
+FORMATS = ('text', 'jsonl', 'csv', 'parquet')
+
+# fields each output reads, so lookups can skip the rest
+TEXT_FIELDS = ('rating', 'style', 'abv') # i.e. print_simple / print_fancy (& sorting, filtering)
+SITE_FIELDS = ('rating', 'abv', 'style', 'where') # per site, for rows
+MENU_FIELDS = ('style', 'abv', 'where')
+
+PARQUET_BATCHSIZE = 500 # rows per row group, i.e. most ever held in memory
+
+
+def get_info_ranked(d_stats, k_info, l_ranked_ks=INFO_RANKING):
+    """
+    dict of beer stats, key for info, list of ranked keys -> info under highest ranked key available
+       i.e. d_stats[highest_ranked_k_in_l][k_info]
+    """
+    if not l_ranked_ks: # base case: info not found in any of ranked keys
+        return ''
+
+    top_k, *rest = l_ranked_ks
+    try:
+        return d_stats[top_k][k_info]
+    except(KeyError):
+        return get_info_ranked(d_stats, k_info, rest)
+
+
+def format_rating(rating):
+    """
+    rating (float, or str as scraped) -> str
+    """
+    return '{:.2f}'.format(rating) if isinstance(rating, float) else rating
+
+
+def format_abv(abv):
+    """
+    abv (float, or str as scraped) -> str, e.g. "7.3%"
+    """
+    return '{:g}%'.format(abv) if isinstance(abv, float) else abv
+
+
+def as_dict(stats):
+    """
+    statsdict or records.Stats -> plain dict (e.g. for json)
+    """
+    return dict(stats.items()) if stats else {}
+
+
+def format_simple(beer, d_stats, maxwidth, sites=SITES, sep='|', spacer=' ', terse=True,
+                  marker=''):
+    """
+    beer, sitesdict of statsdicts -> "[ ratings ]  beer  (style · abv)" line
+    """
+    statss = [d_stats.get(site) or {} for site in sites] # rating sites only
+
+    reviewtxt = '{sep}'.join(['{:^6}'] * len(sites)).format(
+        *(format_rating(stats.get('rating', '…' if stats.get('pending') else '')) # … = timed out
+          for stats in statss),
+        sep=sep)
+
+    style = get_info_ranked(d_stats, 'style').lower()
+    abv   = format_abv(get_info_ranked(d_stats, 'abv'))
+
+    if terse:
+        style = re.sub(' -.*$', '', style)
+
+    return '{}[{}]{spacer}{:<{width}}{spacer}({} · {})'.format(marker, reviewtxt, beer,
+                                                             style, abv, width=maxwidth,
+                                                             spacer=spacer)
+
+
+def format_key(sites=SITES, sep='|', spacer=' '):
+    """
+    -> "[ site | site | .. ]  ==  key" line
+    """
+    maxsitewidth = max((len(site) for site in sites))
+    sitetxt = '{sep}'.join(['{:^{width}}'] * len(sites)).format(*sites,
+                                                                sep=sep,
+                                                                width=maxsitewidth + 2)
+    return '[{}]{spacer}=={spacer}key'.format(sitetxt, spacer=spacer)
+
+
+def columns(sites=SITES):
+    """
+    -> flat column names, e.g. bar, beer, rating, untappd_rating, .., serving
+    """
+    return (['bar', 'beer', 'rating', 'pending'] +
+            ['{}_{}'.format(site, k) for site in sites for k in SITE_FIELDS] +
+            ['beermenus_{}'.format(k) for k in MENU_FIELDS] +
+            ['serving'])
+
+
+def avg_rating(d_stats, sites=SITES):
+    ratings = [float(d_stats[site]['rating']) for site in sites
+               if (d_stats.get(site) or {}).get('rating')]
+    return round(sum(ratings) / len(ratings), 3) if ratings else None
+
+
+def is_pending(d_stats):
+    return any((stats or {}).get('pending') for stats in d_stats.values())
+
+
+def to_record(bar, beer, d_stats, sites=SITES):
+    """
+    bar, beer, sitesdict of statsdicts -> nested dict (i.e. json line)
+    """
+    return {
+        'bar': bar,
+        'beer': beer,
+        'rating': avg_rating(d_stats, sites),
+        'pending': is_pending(d_stats),
+        'sites': {site: as_dict(d_stats.get(site)) for site in sites},
+        'beermenus': d_stats.get('beermenus') or {}
+    }
+
+
+def to_row(bar, beer, d_stats, sites=SITES):
+    """
+    bar, beer, sitesdict of statsdicts -> flat dict (i.e. csv / parquet row), w servings as "16oz draft $7; .."
+    """
+    d_menu = d_stats.get('beermenus') or {}
+
+    row = {'bar': bar, 'beer': beer, 'rating': avg_rating(d_stats, sites),
+           'pending': is_pending(d_stats)}
+    D_FORMATS = dict(rating=format_rating, abv=format_abv) # (as str, like beermenus')
+    for site in sites:
+        stats = d_stats.get(site) or {}
+        row.update(('{}_{}'.format(site, k), D_FORMATS.get(k, lambda v: v)(stats.get(k)))
+                   for k in SITE_FIELDS)
+    row.update(('beermenus_{}'.format(k), d_menu.get(k) or None) for k in MENU_FIELDS)
+    row['serving'] = '; '.join(' '.join(filter(None, (d.get('volume'), d.get('type'),
+                                                     d.get('price'))))
+                               for d in d_menu.get('serving', [])) or None
+    return row
+
+
+class Writer(object):
+    """
+    streams rows to file as they're written (& flushes, for pipes)
+    """
+
+    def __init__(self, f, sites=SITES):
+        self.f = f
+        self.sites = sites
+
+    def write(self, bar, beer, d_stats):
+        raise NotImplementedError
+
+    def close(self):
+        self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JsonlWriter(Writer):
+
+    def write(self, bar, beer, d_stats):
+        self.f.write(json.dumps(to_record(bar, beer, d_stats, self.sites)) + '\n')
+        self.f.flush()
+
+
+class CsvWriter(Writer):
+
+    def __init__(self, f, sites=SITES, header=True):
+        super().__init__(f, sites)
+        self.writer = csv.DictWriter(f, fieldnames=columns(sites))
+        if header:
+            self.writer.writeheader()
+
+    def write(self, bar, beer, d_stats):
+        self.writer.writerow(to_row(bar, beer, d_stats, self.sites))
+        self.f.flush()
+
+
+class ParquetWriter(Writer):
+    """
+    rows -> parquet, one row group per batch (requires pyarrow)
+    """
+
+    def __init__(self, f, sites=SITES, batchsize=PARQUET_BATCHSIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(f, sites)
+        self.pa = pa
+        self.batchsize = batchsize
+
+        self.schema = pa.schema([(k, pa.float64() if k == 'rating' else
+                                  pa.bool_() if k == 'pending' else pa.string())
+                                 for k in columns(sites)])
+        self.writer = pq.ParquetWriter(f, self.schema)
+        self.rows = []
+
+    def write(self, bar, beer, d_stats):
+        self.rows.append(to_row(bar, beer, d_stats, self.sites))
+        if len(self.rows) >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        super().close()
+
+
+D_WRITERS = dict(
+    jsonl = JsonlWriter,
+    csv = CsvWriter,
+    parquet = ParquetWriter
+)
+
+
+def get_writer(fmt, f=sys.stdout, sites=SITES, append=False):
+    """
+    format, open file -> streaming writer (or None, for text)
+
+    :append: continuing earlier output (e.g. resumed run), so no csv header
+    """
+    if fmt == 'text':
+        return None
+
+    if fmt == 'csv':
+        return CsvWriter(f, sites=sites, header=not append)
+
+    if fmt == 'parquet':
+        if append:
+            sys.exit('parquet output can\'t be appended to (use jsonl or csv to resume)')
+
+        try:
+            import pyarrow
+        except(ImportError):
+            sys.exit('parquet output requires pyarrow (pip install pyarrow)')
+
+        f = getattr(f, 'buffer', f) # binary
+
+    return D_WRITERS[fmt](f, sites=sites)
@@ -0,0 +1,196 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+import time
+
+from cache import CACHE_PATH, SqliteStore, get_cache
+from get_beer import (D_ACTIONS, D_BATCH_ACTIONS, get_bar_cached, get_beerpages,
+                      get_beers_cached, get_site_stats, prefetch_batched, split_menu)
+from names import canonicalize
+from profiling import count, span
+from sites import REGISTRY
+
+
+INTERVAL = 15 * 60 # s between sweeps (i.e. menu TTL)
+REFRESH_AT = 0.8   # fraction of TTL after which reviews are refreshed, ahead of expiry
+MISSING = 2.0      # staleness of reviews never fetched, i.e. before any merely stale ones
+BUDGET = 200       # (beer, site) lookups per sweep, at most
+WORKERS = 2        # concurrent lookups, so scraping trickles (under the rate limits) rather than bursts
+
+
+class Watchlist(SqliteStore):
+    """
+    bar queries to keep warm
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS watchlist ('
+        'query TEXT PRIMARY KEY, '
+        'added REAL NOT NULL)',
+    )
+
+    def add(self, query):
+        self.conn.execute('INSERT OR IGNORE INTO watchlist VALUES (?, ?)', (query, time.time()))
+
+    def remove(self, query):
+        self.conn.execute('DELETE FROM watchlist WHERE query = ?', (query,))
+
+    def queries(self):
+        return [query for query, in self.conn.execute('SELECT query FROM watchlist ORDER BY added')]
+
+
+def plan(beerlsts, sites=D_ACTIONS.keys(), refresh_at=REFRESH_AT):
+    """
+    lsts of beers (1 per bar) -> [(priority, beer, site)] to look up, most urgent first
+
+    priority = staleness (age / TTL) x popularity (# bars pouring it)
+    """
+    cache = get_cache()
+
+    d_popularity = Counter(canonicalize(beer) for beerlst in beerlsts
+                           for beer in set(beerlst))
+    d_unique = {}
+    for beerlst in beerlsts:
+        for beer in beerlst:
+            d_unique.setdefault(canonicalize(beer), beer)
+
+    jobs = []
+    for k, beer in d_unique.items():
+        for site in sites:
+            staleness = cache.staleness(k, site)
+            staleness = staleness if staleness is not None else MISSING
+
+            if staleness >= refresh_at:
+                jobs.append((staleness * d_popularity[k], beer, site))
+
+    return sorted(jobs, key=lambda job: job[0], reverse=True)
+
+
+def lookup(beer, site):
+    """
+    beer, site -> None, after (re)scraping into cache
+    """
+    try:
+        beerpages = (get_beerpages(beer) if REGISTRY[site].needs_resolver # (cached, so not re-searched)
+                     else {})
+        get_site_stats(beer, site, beerpages=beerpages, refresh=True)
+    except(Exception): # e.g. network, blocked -> next sweep
+        count('prefetch.error:' + site)
+
+
+def lookup_batched(beerlst):
+    try:
+        prefetch_batched(beerlst, refresh=True)
+    except(Exception):
+        count('prefetch.error:batch')
+
+
+class Prefetcher(object):
+    """
+    periodically refreshes watched bars' menus, then their new / stale reviews (budgeted & trickled)
+    """
+
+    def __init__(self, watchlist=None, interval=INTERVAL, budget=BUDGET, workers=WORKERS,
+                 verbose=False):
+        self.watchlist = watchlist if watchlist is not None else Watchlist(CACHE_PATH)
+        self.interval = interval
+        self.budget = budget
+        self.workers = workers
+        self.verbose = verbose
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        """
+        -> n (beer, site) lookups run
+        """
+        beerlsts = []
+        for query in self.watchlist.queries():
+            try:
+                barname, bar_url = get_bar_cached(query)
+                d_beermenus = get_beers_cached(bar_url) # revalidated once stale
+            except(Exception, SystemExit): # e.g. bar gone
+                count('prefetch.error:menu')
+                continue
+
+            beerlst_taps, beerlst_cans = split_menu(barname, d_beermenus)
+            beerlsts.append(beerlst_taps + beerlst_cans)
+
+        jobs = plan(beerlsts)[:self.budget]
+
+        # sites w batch lookup -> a request per batch, rather than per beer
+        beerlst_batched = [beer for _, beer, site in jobs if site in D_BATCH_ACTIONS]
+
+        with span('prefetch'), ThreadPoolExecutor(self.workers) as pool:
+            if beerlst_batched:
+                pool.submit(lookup_batched, beerlst_batched)
+
+            for _, beer, site in jobs:
+                if site not in D_BATCH_ACTIONS:
+                    pool.submit(lookup, beer, site)
+
+        if self.verbose:
+            print('[{}] prefetched {} reviews across {} bars'.format(
+                time.strftime('%H:%M:%S'), len(jobs), len(beerlsts)), file=sys.stderr)
+
+        return len(jobs)
+
+    def run(self):
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def get_parser():
+
+    parser = argparse.ArgumentParser(description='keep watched bars\' menus & ratings warm')
+    parser.add_argument('action', choices=('add', 'remove', 'list', 'run'))
+    parser.add_argument('bar', nargs='*')
+    parser.add_argument('--once', action='store_true',
+                        help='single sweep, then exit? (default: every --interval)')
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help='s between sweeps (default: {})'.format(INTERVAL))
+    parser.add_argument('--budget', type=int, default=BUDGET,
+                        help='lookups per sweep, at most (default: {})'.format(BUDGET))
+    parser.add_argument('-t', '--nthreads', type=int, default=WORKERS,
+                        help='concurrent lookups (default: {})'.format(WORKERS))
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    watchlist = Watchlist(CACHE_PATH)
+    barquery = ' '.join(args.bar)
+
+    if args.action == 'add':
+        watchlist.add(barquery)
+    elif args.action == 'remove':
+        watchlist.remove(barquery)
+    elif args.action == 'list':
+        print('\n'.join(watchlist.queries()))
+
+    else:
+        prefetcher = Prefetcher(watchlist, interval=args.interval, budget=args.budget,
+                                workers=args.nthreads, verbose=True)
+        if args.once:
+            prefetcher.sweep()
+        else:
+            try:
+                prefetcher.run()
+            except(KeyboardInterrupt):
+                pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+
+ENV_PROFILE = 'LSBEER_PROFILE' # on in env, so also on in spawned workers (though their stats stay there)
+
+_LOCK = threading.Lock()
+
+_SPANS = []                  # (name, start s, duration s, pid, thread id), for trace
+_TIMES = defaultdict(list)   # name -> durations (s)
+_COUNTS = defaultdict(int)   # name -> count
+
+_T0 = time.perf_counter()
+
+
+def enable(on=True):
+    os.environ[ENV_PROFILE] = '1' if on else '0'
+
+
+def is_enabled():
+    return os.environ.get(ENV_PROFILE, '0') not in ('', '0')
+
+
+@contextmanager
+def span(name):
+    """
+    time block under name, e.g. "fetch:untappd.com" (category before colon)
+    """
+    if not is_enabled():
+        yield
+        return
+
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        with _LOCK:
+            _TIMES[name].append(dt)
+            _SPANS.append((name, t - _T0, dt, os.getpid(), threading.get_ident()))
+
+
+def count(name, n=1):
+    """
+    add n to counter, e.g. "bytes:untappd.com", "cache.hit:ratebeer", "retry:google.com"
+    """
+    if not is_enabled():
+        return
+
+    with _LOCK:
+        _COUNTS[name] += n
+
+
+def reset():
+    with _LOCK:
+        _SPANS.clear()
+        _TIMES.clear()
+        _COUNTS.clear()
+
+
+def quantile(sorted_xs, q):
+    return sorted_xs[min(int(q * len(sorted_xs)), len(sorted_xs) - 1)]
+
+
+def get_stats():
+    """
+    -> {'spans': {name: {n, total, mean, p50, p90, p99, max}}, 'counts': {name: n}, 'cache_hit_rates': {site: rate}}
+    """
+    with _LOCK:
+        d_times = {k: sorted(v) for k, v in _TIMES.items()}
+        d_counts = dict(_COUNTS)
+
+    d_spans = {
+        name: dict(n=len(ts),
+                   total=sum(ts),
+                   mean=sum(ts) / len(ts),
+                   p50=quantile(ts, 0.5),
+                   p90=quantile(ts, 0.9),
+                   p99=quantile(ts, 0.99),
+                   max=ts[-1])
+        for name, ts in sorted(d_times.items())
+    }
+
+    sites = {k.split(':', 1)[1] for k in d_counts.keys()
+             if k.startswith(('cache.hit:', 'cache.miss:'))}
+    d_hitrates = {}
+    for site in sorted(sites):
+        hits = d_counts.get('cache.hit:' + site, 0)
+        misses = d_counts.get('cache.miss:' + site, 0)
+        d_hitrates[site] = hits / (hits + misses)
+
+    return {'spans': d_spans, 'counts': dict(sorted(d_counts.items())),
+            'cache_hit_rates': d_hitrates}
+
+
+def summary():
+    """
+    -> printable table of span latencies (ms), counters & cache hit rates
+    """
+    d = get_stats()
+
+    maxwidth = max((len(k) for k in list(d['spans']) + list(d['counts'])), default=4)
+
+    lines = ['{:<{w}}{:>7}{:>11}{:>9}{:>9}{:>9}{:>9}{:>9}'.format(
+        'span', 'n', 'total ms', 'mean', 'p50', 'p90', 'p99', 'max', w=maxwidth + 2)]
+    for name, stats in d['spans'].items():
+        lines.append('{:<{w}}{:>7}{:>11.0f}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}'.format(
+            name, stats['n'], *(1000 * stats[k] for k in ('total', 'mean', 'p50',
+                                                          'p90', 'p99', 'max')),
+            w=maxwidth + 2))
+
+    if d['counts']:
+        lines.append('')
+        lines.append('{:<{w}}{:>7}'.format('counter', 'n', w=maxwidth + 2))
+        lines.extend('{:<{w}}{:>7}'.format(name, n, w=maxwidth + 2)
+                     for name, n in d['counts'].items())
+
+    if d['cache_hit_rates']:
+        lines.append('')
+        lines.append('cache hit rate: ' + ' · '.join('{} {:.0%}'.format(site, rate)
+                                                     for site, rate in d['cache_hit_rates'].items()))
+
+    return '\n'.join(lines)
+
+
+def export_json(path):
+    """
+    stats -> json file
+    """
+    with open(path, 'w') as f:
+        json.dump(get_stats(), f, indent=2)
+
+
+def export_trace(path):
+    """
+    spans -> chrome trace file (i.e. for chrome://tracing or ui.perfetto.dev)
+    """
+    with _LOCK:
+        spans = list(_SPANS)
+        d_counts = dict(_COUNTS)
+
+    events = [
+        {'name': name, 'cat': name.split(':')[0], 'ph': 'X',
+         'ts': 1e6 * start, 'dur': 1e6 * dur, 'pid': pid, 'tid': tid}
+        for name, start, dur, pid, tid in spans
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'otherData': {'counts': d_counts}}, f)
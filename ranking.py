@@ -0,0 +1,143 @@
+import numpy as np
+
+from output import SITES, get_info_ranked
+from records import to_number
+from sites import MENU
+
+
+# results as columns (1 row per beer), so ranking & filtering are array ops rather than per-beer dict walks
+
+STYLE_KEYS = SITES + (MENU,) # where styles come from (for --filter-by)
+
+
+def to_float(txt):
+    """
+    rating / abv (str or float) -> float (or nan)
+    """
+    number = to_number(txt)
+    return number if number is not None else np.nan
+
+
+class Table(object):
+    """
+    beers x sites results, as typed columns
+
+    :ratings: n x sites float array (nan = not found)
+    :abvs: n float array (nan = unknown)
+    :styles: n x style keys int array, codes into vocab (lowercase style -> code, & 0 = none)
+    """
+
+    def __init__(self, beers, ratings, abvs, styles, vocab, sites=SITES):
+        self.beers = beers
+        self.ratings = ratings
+        self.abvs = abvs
+        self.styles = styles
+        self.vocab = vocab
+        self.sites = sites
+
+    @classmethod
+    def from_dicts(cls, beerlst, d_beers, sites=SITES):
+        """
+        lst of beers, beerdict of sitesdicts of statsdicts -> Table
+        """
+        n = len(beerlst)
+        ratings = np.full((n, len(sites)), np.nan)
+        abvs = np.full(n, np.nan)
+        styles = np.zeros((n, len(STYLE_KEYS)), dtype=np.int32)
+        vocab = {'': 0}
+
+        for i, beer in enumerate(beerlst):
+            d_stats = d_beers[beer]
+
+            for j, site in enumerate(sites):
+                rating = (d_stats.get(site) or {}).get('rating')
+                if rating:
+                    ratings[i, j] = to_float(rating)
+
+            abvs[i] = to_float(get_info_ranked(d_stats, 'abv'))
+
+            for j, k in enumerate(STYLE_KEYS):
+                style = (d_stats.get(k) or {}).get('style', '').lower()
+                styles[i, j] = vocab.setdefault(style, len(vocab))
+
+        return cls(list(beerlst), ratings, abvs, styles, vocab, sites)
+
+    def __len__(self):
+        return len(self.beers)
+
+    @property
+    def found(self):
+        """
+        -> n x sites bool array, i.e. which sites have a rating for each beer
+        """
+        return ~np.isnan(self.ratings)
+
+    def consensus(self, weights=None):
+        """
+        -> n float array, (weighted) mean rating across sites that have one (or -1 if none)
+
+        :weights: {site: weight} (default: equal)
+        """
+        w = np.array([1. if weights is None else weights.get(site, 0.) for site in self.sites])
+        w = self.found * w # (n x sites)
+
+        total = w.sum(axis=1)
+        scores = (np.nan_to_num(self.ratings) * w).sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, scores / total, -1.)
+
+    def by_site(self, site):
+        """
+        -> n float array, site's rating (or -1 if none)
+        """
+        ratings = self.ratings[:, self.sites.index(site)]
+        return np.where(np.isnan(ratings), -1., ratings)
+
+    def mask(self, filter_by=(), min_rating=None, min_abv=None, weights=None):
+        """
+        -> n bool array of beers kept, i.e. w any style in filter_by (whole style, any case)
+           & consensus rating / abv at least min (unknown counts as below)
+        """
+        kept = np.ones(len(self), dtype=bool)
+
+        if filter_by:
+            wanted = [self.vocab[style.lower()] for style in filter_by
+                      if style.lower() in self.vocab]
+            kept &= np.isin(self.styles, wanted).any(axis=1)
+
+        if min_rating is not None:
+            kept &= self.consensus(weights) >= min_rating
+
+        if min_abv is not None:
+            with np.errstate(invalid='ignore'):
+                kept &= self.abvs >= min_abv # (nan -> False)
+
+        return kept
+
+    def rank(self, sort_by=None, mask=None, weights=None):
+        """
+        -> lst of beers, best -> worst, by consensus rating (or by site's, then consensus)
+
+        ties keep original order
+        """
+        keys = [-self.consensus(weights)]
+        if sort_by:
+            keys.append(-self.by_site(sort_by)) # (lexsort: last key is primary)
+
+        order = np.lexsort(keys) # stable
+        if mask is not None:
+            order = order[mask[order]]
+
+        return [self.beers[i] for i in order]
+
+
+def is_kept(d_stats, filter_by=(), min_rating=None, min_abv=None):
+    """
+    sitesdict of statsdicts -> bool, as for Table.mask (e.g. for beers streamed as they land)
+    """
+    if not (filter_by or min_rating is not None or min_abv is not None):
+        return True
+
+    return bool(Table.from_dicts([None], {None: d_stats}).mask(filter_by, min_rating,
+                                                                min_abv)[0])
@@ -0,0 +1,197 @@
+import os
+import random
+import threading
+import time
+
+from sites import REGISTRY
+
+
+ENV_RATES = 'LSBEER_RATES' # e.g. "untappd.com=0.5,google.com=1:2:3" (rate[:burst[:max rate]])
+ENV_SHARE = 'LSBEER_RATE_SHARE' # n processes splitting the limits (i.e. multiprocessing pool)
+
+# domain -> (requests / s, burst, max requests / s)
+D_LIMITS = dict(
+    {site.domain: site.limits for site in REGISTRY.values()}, # (see sites.py)
+    **{'google.com': (1, 2, 3),
+       'beermenus.com': (2, 4, 6)}
+)
+DEFAULT_LIMITS = (5, 5, 20)
+
+MIN_RATE = 0.1   # requests / s
+INCREASE = 1.05  # rate multiplier per success..
+DECREASE = 0.5   # .. & per throttle (429 / 503)
+
+BACKOFF = 1      # s, doubled per retry (w jitter)
+MAX_BACKOFF = 60 # s
+
+
+class TokenBucket(object):
+    """
+    token bucket w adaptive rate: creeps up on success (to max_rate), halves when throttled
+
+    clock & sleep are swappable, for testing
+    """
+
+    def __init__(self, rate, burst=1, max_rate=None, min_rate=MIN_RATE,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.min_rate = min(min_rate, rate)
+
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = burst
+        self.last = clock()
+        self.paused_until = 0
+
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        -> s waited, after blocking until a request is allowed
+        """
+        with self._lock:
+            now = self.clock()
+
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            # reserve token (may go negative, i.e. queue behind other waiters)
+            wait = max(0, (1 - self.tokens) / self.rate, self.paused_until - now)
+            self.tokens -= 1
+
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * INCREASE)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * DECREASE)
+
+            if retry_after is not None: # server said when
+                self.paused_until = max(self.paused_until, self.clock() + retry_after)
+
+
+def parse_limits(txt):
+    """
+    "domain=rate[:burst[:max rate]],..." -> {domain: (rate, burst, max rate)}
+    """
+    d_limits = {}
+    for item in filter(None, (_.strip() for _ in txt.split(','))):
+        domain, limits = item.split('=')
+        rate, *rest = (float(_) for _ in limits.split(':'))
+        burst = rest[0] if len(rest) > 0 else max(1, rate)
+        max_rate = rest[1] if len(rest) > 1 else rate
+        d_limits[domain.strip()] = (rate, burst, max_rate)
+
+    return d_limits
+
+
+def parse_retry_after(value):
+    """
+    Retry-After header -> s (or None)
+    """
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except(ValueError): # http date
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except(TypeError, ValueError):
+            return None
+
+
+def backoff(attempt, retry_after=None):
+    """
+    attempt # -> s to wait before retrying (jittered exponential, or as told)
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF)
+    return min(MAX_BACKOFF, BACKOFF * 2**attempt) * random.uniform(0.5, 1.5)
+
+
+class RateLimiter(object):
+    """
+    per-domain token buckets, shared by all threads
+    """
+
+    def __init__(self, d_limits=None, default_limits=DEFAULT_LIMITS, share=1, **kwargs):
+        self.d_limits = dict(D_LIMITS, **(d_limits or {}))
+        self.default_limits = default_limits
+        self.share = share   # i.e. this process gets 1/share of each limit
+        self.kwargs = kwargs # -> TokenBucket
+
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def domain(self, host):
+        host = (host or '').lower()
+        return next((domain for domain in self.d_limits.keys()
+                     if host == domain or host.endswith('.' + domain)), host)
+
+    def bucket(self, host):
+        domain = self.domain(host)
+        try:
+            return self.buckets[domain]
+        except(KeyError):
+            with self._lock:
+                if domain not in self.buckets:
+                    rate, burst, max_rate = self.d_limits.get(domain, self.default_limits)
+                    self.buckets[domain] = TokenBucket(rate / self.share,
+                                                       burst=max(1, burst / self.share),
+                                                       max_rate=max_rate / self.share,
+                                                       **self.kwargs)
+            return self.buckets[domain]
+
+    def acquire(self, host):
+        return self.bucket(host).acquire()
+
+    def on_success(self, host):
+        self.bucket(host).on_success()
+
+    def on_throttle(self, host, retry_after=None):
+        self.bucket(host).on_throttle(retry_after)
+
+
+def configure(rates=None, share=None):
+    """
+    set per-domain limits, as "domain=rate[:burst[:max rate]],...", &/or n processes sharing them
+
+    (env, so also carries over to spawned workers)
+    """
+    if rates:
+        os.environ[ENV_RATES] = rates
+    if share:
+        os.environ[ENV_SHARE] = str(share)
+
+    global _LIMITER
+    _LIMITER = None
+
+
+_LIMITER = None
+_LIMITER_PID = None
+_LOCK = threading.Lock()
+
+def get_limiter():
+    """
+    -> rate limiter shared by all threads of this process
+    """
+    global _LIMITER, _LIMITER_PID
+
+    pid = os.getpid()
+    if _LIMITER is None or _LIMITER_PID != pid:
+        with _LOCK:
+            if _LIMITER is None or _LIMITER_PID != pid:
+                _LIMITER = RateLimiter(parse_limits(os.environ.get(ENV_RATES, '')),
+                                       share=max(1, int(os.environ.get(ENV_SHARE, 1))))
+                _LIMITER_PID = pid
+
+    return _LIMITER
@@ -0,0 +1,117 @@
+import re
+import sys
+
+
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def to_number(txt):
+    """
+    rating / abv str (e.g. "4.05", "7.3%") -> float (or None)
+    """
+    if isinstance(txt, (int, float)) and not isinstance(txt, bool):
+        return float(txt)
+
+    match = NUMBER.search(txt) if isinstance(txt, str) else None
+    return float(match.group()) if match else None
+
+
+def intern(txt):
+    return sys.intern(txt) if isinstance(txt, str) else txt
+
+
+class Stats(object):
+    """
+    one site's stats for a beer, in place of its statsdict: slotted (no per-beer dict), w rating & abv as floats
+    & style / where interned (shared across beers)
+
+    reads like the statsdict (stats.get('rating'), 'style' in stats, .items(), ..), w unset fields absent
+    """
+    FIELDS = ('rating', 'abv', 'style', 'where', 'description', 'pending')
+    __slots__ = FIELDS
+
+    def __init__(self, rating=None, abv=None, style=None, where=None, description=None,
+                 pending=None):
+        self.rating = rating
+        self.abv = abv
+        self.style = style
+        self.where = where
+        self.description = description
+        self.pending = pending
+
+    @classmethod
+    def from_dict(cls, d_stats, descriptions=False):
+        """
+        statsdict (as scraped / cached) -> Stats
+
+        :descriptions: keep description text? (i.e. only if the output wants it)
+        """
+        return cls(rating=to_number(d_stats.get('rating')),
+                   abv=to_number(d_stats.get('abv')),
+                   style=intern(d_stats.get('style')),
+                   where=intern(d_stats.get('where')),
+                   description=(d_stats.get('description') if descriptions else None),
+                   pending=(d_stats.get('pending') or None))
+
+    def __reduce__(self):
+        # pickled (e.g. back from Pool workers) as bare tuple of values, rather than per-field names
+        return (Stats, tuple(getattr(self, k) for k in self.FIELDS))
+
+    def keys(self):
+        return [k for k in self.FIELDS if getattr(self, k) is not None]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def values(self):
+        return [v for _, v in self.items()]
+
+    def get(self, k, default=None):
+        v = getattr(self, k, None) if k in self.FIELDS else None
+        return v if v is not None else default
+
+    def __getitem__(self, k):
+        v = self.get(k)
+        if v is None:
+            raise KeyError(k)
+        return v
+
+    def __contains__(self, k):
+        return self.get(k) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.items()) == (dict(other.items()) if other is not None else None)
+
+    def __repr__(self):
+        return 'Stats({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
+
+
+class LazyStats(Stats):
+    """
+    Stats w fields the run left out (e.g. descriptions) looked up on first access, via fetch() -> Stats
+    (e.g. for --interactive, where most are never looked at)
+    """
+    __slots__ = ('fetch', 'unfetched')
+
+    def __init__(self, *args, fetch=None, unfetched=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetch = fetch
+        self.unfetched = tuple(unfetched)
+
+    @classmethod
+    def from_stats(cls, stats, fetch, unfetched):
+        return cls(*(getattr(stats, k) for k in cls.FIELDS), fetch=fetch, unfetched=unfetched)
+
+    def get(self, k, default=None):
+        if k in self.unfetched:
+            stats = self.fetch()
+            for k_ in self.unfetched:
+                setattr(self, k_, stats.get(k_))
+            self.unfetched = ()
+        return super().get(k, default)
@@ -1,11 +1,26 @@
+from hashlib import sha1
 from itertools import chain
 import json
 import re
-import requests
 import sys
 from urllib.parse import unquote
 
-from CLIppy import flatten, safe_encode, soup_me
+from ratelimit import get_limiter
+from sessions import fetch, make_soup, soup_me
+from sites import REGISTRY
+
+
+# partial parses: only build tree for elements actually read off each beerpage
+# (as SoupStrainer args, so bs4 needn't load before the first request)
+UNTAPPD_STRAINER = dict(class_=['num', 'abv', 'style', 'info',
+                                'beer-descrption-read-less'])
+BEERADVOCATE_STRAINER = dict(name=['span', 'dd']) # breadcrumbs, rating, beerstats
+
+
+def safe_encode(*args, **kwargs):
+    # CLIppy loaded on first query, rather than on import
+    from CLIppy import safe_encode as safe_encode_
+    return safe_encode_(*args, **kwargs)
 
 
 def get_bar(query):
@@ -31,12 +46,61 @@ def get_bar(query):
     return barname, bar_url
 
 
-def get_beers(bar_url):
+def get_beers(bar_url, from_headless=None):
     """
-    bar_url -> list of beernames, num on tap (listed 1st)
+    bar_url -> {beername: beer stats}
+
+    :from_headless: True (always), False (never), or None (only if plain html has no menu)
     """
-    soup = soup_me(bar_url, from_headless=True)
+    if not from_headless: # fast path: plain http, no browser
+        d_stats = parse_beers(soup_me(bar_url))
+
+        if d_stats or from_headless is False:
+            return d_stats
+
+    return parse_beers(soup_me(bar_url, from_headless=True))
+
+
+def get_beers_if_changed(bar_url, snapshot=None):
+    """
+    bar_url, previous menu snapshot -> menu snapshot (previous one, if page unchanged)
+
+    snapshot = {'beers': {beername: beer stats}, 'etag': .., 'last_modified': .., 'hash': ..}
+    """
+    headers = {}
+    if snapshot: # conditional request
+        if snapshot.get('etag'):
+            headers['If-None-Match'] = snapshot['etag']
+        if snapshot.get('last_modified'):
+            headers['If-Modified-Since'] = snapshot['last_modified']
+
+    response = fetch(bar_url, headers=headers)
 
+    if snapshot and response.status_code == 304: # not modified
+        return snapshot
+
+    digest = sha1(response.content).hexdigest()
+
+    if snapshot and digest == snapshot.get('hash'): # no validators, but same page
+        return snapshot
+
+    d_stats = parse_beers(make_soup(response.text))
+
+    if not d_stats: # needs js
+        d_stats = parse_beers(soup_me(bar_url, from_headless=True))
+
+    return {
+        'beers': d_stats,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'hash': digest
+    }
+
+
+def parse_beers(soup):
+    """
+    beermenus bar page soup -> {beername: beer stats}
+    """
     PATTERN = re.compile('^/beers/')
     beers = [li for li in soup('li', class_='pure-list-item')
              if li('a', href=PATTERN)]
@@ -83,44 +147,48 @@ def get_beers(bar_url):
     return d_stats
 
 
-# TODO wrapper to grab key from SECRETS ?
-def get_reviews_ratebeer(query, beerpage=None, verbose=False):
-    """ Get beer stats
+RATEBEER_API = 'https://beta.ratebeer.com/v1/api/graphql/'
+RATEBEER_FIELDS = [
+    # 'id',
+    # 'name',
+    'averageRating',
+    'abv',
+    # 'overallScore',
+    'description',
+    # 'ratingCount'
+]
+RATEBEER_OPTIONAL = ('description',) # only asked for if wanted (long text, that most outputs never show)
+RATEBEER_BATCHSIZE = 25 # aliased searches per request
 
-    :query: query beername str
-    """
-    if verbose:
-        print('ratebeer...')
-
-    BASE_URL_API = 'https://beta.ratebeer.com/v1/api/graphql/'
 
-    FIELDS = [
-        # 'id',
-        'name',
-        'averageRating',
-        'abv',
-        # 'overallScore',
-        'description',
-        # 'ratingCount'
-    ]
+def ratebeer_fields(fields=None):
+    """
+    fields wanted (default: all) -> graphql fields to ask for
+    """
+    return [k for k in RATEBEER_FIELDS
+            if fields is None or k not in RATEBEER_OPTIONAL or k in fields]
 
-    UNRATED = '0.00'
-    UNABVED = None
 
-    data = {
-        'query': 'query beerSearch($query: String, $order: SearchOrder, $first: Int, $after: ID) { searchResultsArr: beerSearch(query: $query, order: $order, first: $first, after: $after) { totalCount last items { beer { %s __typename } review { id score __typename } __typename   }   __typename } }' % (' '.join(FIELDS)),
-        'variables': {'query': query, 'order': 'MATCH', 'first': 20},
-        'operationName': 'beerSearch'
-    }
-    d_hits = (
-        requests
-        .post(BASE_URL_API,
+def query_ratebeer(data):
+    """
+    graphql query dict -> response data dict
+    """
+    return (
+        fetch(RATEBEER_API, method='POST',
               data=json.dumps(data),
               headers={'content-type': 'application/json'})
-        .json()['data']['searchResultsArr']
+        .json()['data']
     )
 
-    if d_hits['totalCount'] == 0: # no match found
+
+def parse_ratebeer(d_hits):
+    """
+    beerSearch results dict -> beer stats
+    """
+    UNRATED = '0.00'
+    UNABVED = None
+
+    if not d_hits['items']: # no match found
         return {}
 
     top_hit = d_hits['items'][0]['beer']
@@ -141,15 +209,14 @@ def get_reviews_ratebeer(query, beerpage=None, verbose=False):
     # style
     # where
 
-    # description
-    description = top_hit['description']
-
     beer_stats = {
         # 'abv': abv,
-        'description': description
         # 'style': style,
         # 'where': where,
     }
+    # description (if asked for)
+    if 'description' in top_hit:
+        beer_stats['description'] = top_hit['description']
     if rating != UNRATED:
         beer_stats['rating'] = rating
     if abv != UNABVED:
@@ -158,6 +225,64 @@ def get_reviews_ratebeer(query, beerpage=None, verbose=False):
     return beer_stats
 
 
+# TODO wrapper to grab key from SECRETS ?
+def get_reviews_ratebeer(query, beerpage=None, verbose=False, fields=None):
+    """ Get beer stats
+
+    :query: query beername str
+    :fields: wanted (default: all)
+    """
+    if verbose:
+        print('ratebeer...')
+
+    data = {
+        # top hit only, & only fields used
+        'query': 'query beerSearch($query: String) { searchResultsArr: beerSearch(query: $query, order: MATCH, first: 1) { items { beer { %s } } } }' % (' '.join(ratebeer_fields(fields))),
+        'variables': {'query': query},
+        'operationName': 'beerSearch'
+    }
+    d_hits = query_ratebeer(data)['searchResultsArr']
+
+    return parse_ratebeer(d_hits)
+
+
+def get_reviews_ratebeer_en_masse(queries, verbose=False, fields=None):
+    """ Get beer stats for many beers, via aliased searches (one request per batch)
+
+    :queries: lst of query beername strs
+    :fields: wanted (default: all)
+    :returns: {query: beer_stats} for queries looked up successfully
+    """
+    if verbose:
+        print('ratebeer ({} beers)...'.format(len(queries)))
+
+    queries = list(dict.fromkeys(queries)) # dedupe, in order
+
+    d_stats = {}
+    for i in range(0, len(queries), RATEBEER_BATCHSIZE):
+        batch = queries[i:i + RATEBEER_BATCHSIZE]
+
+        data = {
+            'query': 'query beerSearches({}) {{ {} }}'.format(
+                ', '.join('$q{}: String'.format(j) for j in range(len(batch))),
+                ' '.join('b{j}: beerSearch(query: $q{j}, order: MATCH, first: 1) {{ items {{ beer {{ {} }} }} }}'.format(
+                    ' '.join(ratebeer_fields(fields)), j=j) for j in range(len(batch)))),
+            'variables': {'q{}'.format(j): query for j, query in enumerate(batch)},
+            'operationName': 'beerSearches'
+        }
+        try:
+            d_data = query_ratebeer(data)
+        except(Exception): # whole batch failed (e.g. network, throttled, bad json) -> leave to per-beer lookup
+            continue
+
+        for j, query in enumerate(batch):
+            d_hits = (d_data or {}).get('b{}'.format(j))
+            if d_hits is not None: # else partial error -> leave to per-beer lookup
+                d_stats[query] = parse_ratebeer(d_hits)
+
+    return d_stats
+
+
 def get_reviews_untappd(query, beerpage=None, verbose=False):
     """ Get beer stats
 
@@ -168,9 +293,6 @@ def get_reviews_untappd(query, beerpage=None, verbose=False):
 
     BASE_URL = 'https://untappd.com/{}'
 
-    UNRATED = 'N/A'
-    UNABVED = 'No'
-
     def get_beerpage(query):
         """
         :query: beername query str
@@ -189,7 +311,19 @@ def get_reviews_untappd(query, beerpage=None, verbose=False):
     except(AttributeError): # not found
         return {}
 
-    soup = soup_me(beerpage)
+    try:
+        return parse_untappd(soup_me(beerpage, parse_only=UNTAPPD_STRAINER))
+    except(AssertionError): # ip blocked -> back off, as if throttled
+        get_limiter().on_throttle(REGISTRY['untappd'].domain)
+        raise
+
+
+def parse_untappd(soup):
+    """
+    untappd beerpage soup -> beer stats
+    """
+    UNRATED = 'N/A'
+    UNABVED = 'No'
 
     # mean rating = "?" / 5 #"?/5.0"
     try:
@@ -238,9 +372,6 @@ def get_reviews_beeradvocate(query, beerpage=None, verbose=False):
 
     BASE_URL = 'https://www.beeradvocate.com/{}'
 
-    UNRATED = '0'
-    UNABVED = None
-
     def get_beerpage(query):
         """
         :query: beername query str
@@ -267,13 +398,26 @@ def get_reviews_beeradvocate(query, beerpage=None, verbose=False):
     except(TypeError): # no hits
         return {}
 
-    soup = soup_me(beerpage)
+    beer_stats = parse_beeradvocate(soup_me(beerpage, parse_only=BEERADVOCATE_STRAINER))
+
+    if beer_stats is None: # i.e. place page rather than beer page
+        return (get_reviews_beeradvocate(query, verbose=verbose)
+                if not queried else {}) # if already tried querying beeradvocate, just leave
+
+    return beer_stats
+
+
+def parse_beeradvocate(soup):
+    """
+    beeradvocate beerpage soup -> beer stats (or None if not a beerpage)
+    """
+    UNRATED = '0'
+    UNABVED = None
 
     try:
         assert 'beers' in {s.text.lower() for s in soup('span', itemprop='title')}
     except(AssertionError): # i.e. place page rather than beer page
-        return (get_reviews_beeradvocate(query, verbose=verbose)
-                if not queried else {}) # if already tried querying beeradvocate, just leave
+        return None
 
     # mean rating = "?" / 5 # "?/5.0"
     rating = soup.find('span', class_='ba-ravg').text
@@ -314,11 +458,8 @@ def get_beerpages_en_masse(query):
     :returns: {site: beer_url} for subset of sites found
     """
 
-    D_SITES = dict(
-        untappd = 'https://untappd.com/b/',
-        ratebeer = 'https://www.ratebeer.com/beer/',
-        beeradvocate = 'https://www.beeradvocate.com/beer/'
-    )
+    D_SITES = {site.name: site.beerpage_url for site in REGISTRY.values()
+               if site.needs_resolver} # i.e. sites w lookups that take a beerpage
 
     BASE_URL = 'https://www.google.com/search'
     PARAMS = {'q': safe_encode(query)}
@@ -0,0 +1,231 @@
+import argparse
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import cache
+from client import DEFAULT_SERVER, ENV_SERVER, is_unix
+from get_beer import get_bar_cached, get_beers_cached, iter_beer_dict, split_menu
+from output import to_record
+from sites import SITES
+
+
+NTHREADS = 4 # concurrent requests per site, shared by all queries
+
+
+def iter_menu(query, get_taps=True, get_cans=False, refresh=False, offline=False, **kwargs):
+    """
+    bar query -> iterator of header dict {bar, url, taps, cans}, then a record per beer as it lands
+    """
+    barname, bar_url = get_bar_cached(query, refresh=refresh)
+    d_beermenus = get_beers_cached(bar_url, refresh=refresh, offline=offline)
+
+    beerlst_taps, beerlst_cans = split_menu(barname, d_beermenus)
+    beerlst_taps = beerlst_taps if get_taps else []
+    beerlst_cans = beerlst_cans if get_cans else []
+
+    yield {'bar': barname, 'url': bar_url, 'taps': beerlst_taps, 'cans': beerlst_cans}
+
+    beerlst = list(dict.fromkeys(beerlst_taps + beerlst_cans))
+    for beer, d_stats in iter_beer_dict(beerlst, refresh=refresh, offline=offline,
+                                        progress=False, **kwargs):
+        d_stats['beermenus'] = d_beermenus.get(beer, {})
+        yield to_record(barname, beer, d_stats, sites=SITES)
+
+
+def iter_beers(beerlst, barname='', refresh=False, offline=False, **kwargs):
+    """
+    lst of beers -> iterator of header dict, then a record per beer as it lands
+    """
+    yield {'bar': barname, 'url': None, 'taps': beerlst, 'cans': []}
+
+    for beer, d_stats in iter_beer_dict(beerlst, refresh=refresh, offline=offline,
+                                        progress=False, **kwargs):
+        yield to_record(barname, beer, d_stats, sites=SITES)
+
+
+class Server(object):
+    """
+    long-running lsbeer: sessions, rate limits & (in-memory) caches stay warm & are shared by all queries
+    """
+
+    def __init__(self, nthreads=NTHREADS):
+        self.nthreads = nthreads
+        self.started = time.time()
+
+        self.n_queries = 0
+        self._locks = {} # query -> [lock, n holding / waiting], so identical queries in flight scrape once
+                         # (rest hit cache), & dropped once done w (so distinct queries don't pile up)
+        self._lock = threading.Lock()
+
+        cache.use_memory()
+
+    @contextmanager
+    def locked(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def query(self, path, params, body=None):
+        """
+        endpoint, query params (& json body) -> iterator of dicts
+        """
+        flag = lambda k, default=False: (params.get(k, [str(int(default))])[0]
+                                         not in ('', '0', 'false'))
+        number = lambda k: float(params[k][0]) if params.get(k) else None
+
+        kwargs = dict(refresh=flag('refresh'),
+                      offline=flag('offline'),
+                      nthreads=int(number('nthreads') or self.nthreads),
+                      deadline=number('deadline'),
+                      site_timeouts=dict.fromkeys(SITES, number('site_timeout')),
+                      hedge=flag('hedge'))
+
+        if path == '/menu':
+            return iter_menu(params['bar'][0], get_taps=flag('taps', True),
+                             get_cans=flag('cans'), **kwargs)
+
+        if path == '/beers':
+            d_body = json.loads(body or '{}')
+            return iter_beers(d_body.get('beers', []) + params.get('beer', []),
+                              barname=d_body.get('bar', ''), **kwargs)
+
+        if path == '/health':
+            return iter([{'ok': True, 'pid': os.getpid(), 'queries': self.n_queries,
+                          'uptime': time.time() - self.started}])
+
+        raise KeyError(path)
+
+    def make_handler(server):
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def respond(self, body=None):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+
+                try:
+                    results = server.query(parsed.path, params, body)
+                except(KeyError) as e:
+                    self.send_error(404 if parsed.path not in ('/menu', '/beers') else 400,
+                                    'missing {}'.format(e))
+                    return
+
+                # streamed as ndjson, one line per result as it lands (& connection closed at end)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+
+                server.n_queries += 1
+                with server.locked(self.path + (body or '')):
+                    try:
+                        for d in results:
+                            self.wfile.write((json.dumps(d) + '\n').encode('utf-8'))
+                            self.wfile.flush()
+
+                    except(BrokenPipeError, ConnectionResetError): # client left
+                        pass
+                    except(Exception, SystemExit) as e: # e.g. bar not found
+                        error = 'not found' if isinstance(e, SystemExit) else str(e)
+                        self.wfile.write((json.dumps({'error': error}) + '\n').encode('utf-8'))
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.respond(self.rfile.read(length).decode('utf-8') if length else None)
+
+            def log_message(self, fmt, *args):
+                sys.stderr.write('[{}] {}\n'.format(time.strftime('%H:%M:%S'), fmt % args))
+
+        return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('local', 0) # (for handler logging)
+
+
+def serve(address=DEFAULT_SERVER, nthreads=NTHREADS):
+    """
+    address ("host:port" or path/to/unix.sock) -> serve forever
+    """
+    handler = Server(nthreads=nthreads).make_handler()
+
+    if is_unix(address):
+        if os.path.exists(address): # stale
+            os.remove(address)
+        httpd = UnixHTTPServer(address, handler)
+    else:
+        host, port = address.rsplit(':', 1)
+        httpd = ThreadingHTTPServer((host, int(port)), handler)
+        httpd.daemon_threads = True
+
+    print('lsbeer serving on {}'.format(address))
+    try:
+        httpd.serve_forever()
+    except(KeyboardInterrupt):
+        pass
+    finally:
+        httpd.server_close()
+        if is_unix(address):
+            os.remove(address)
+
+
+def get_parser():
+
+    parser = argparse.ArgumentParser(description='lsbeer daemon: warm sessions & caches, shared by all queries')
+    parser.add_argument('--listen', default=os.environ.get(ENV_SERVER, DEFAULT_SERVER),
+                        help='host:port or path/to/socket (default: ${} or {})'.format(
+                            ENV_SERVER, DEFAULT_SERVER))
+    parser.add_argument('-t', '--nthreads', type=int, default=NTHREADS,
+                        help='concurrent requests per site (default: {})'.format(NTHREADS))
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='per-request timeout, in s (default: 15)')
+    parser.add_argument('--retries', type=int, default=None,
+                        help='retries per failed request (default: 2)')
+    parser.add_argument('--rates', default=None,
+                        help='per-site request limits, as "domain=req/s[:burst[:max req/s]],..." (default: built-in)')
+    parser.add_argument('--http2', action='store_true',
+                        help='use HTTP/2, if httpx[http2] installed? (default: false)')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='keep watched bars (see `lsbeer prefetch add`) warm in the background? (default: false)')
+    parser.add_argument('--prefetch-interval', type=float, default=None,
+                        help='s between prefetch sweeps (default: 900)')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    import ratelimit, sessions
+    sessions.configure(timeout=args.timeout, retries=args.retries, http2=args.http2)
+    ratelimit.configure(rates=args.rates)
+
+    if args.prefetch: # shares this process's rate limits & caches w queries
+        from prefetch import INTERVAL, Prefetcher
+        Prefetcher(interval=(args.prefetch_interval or INTERVAL), verbose=True).start()
+
+    serve(args.listen, nthreads=args.nthreads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+from hashlib import sha1
+from importlib.util import find_spec
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from profiling import count, span
+from ratelimit import backoff, get_limiter, parse_retry_after
+
+
+# settings live in env, so they carry over to spawned (as well as forked) workers
+ENV_TIMEOUT = 'LSBEER_TIMEOUT'
+ENV_RETRIES = 'LSBEER_RETRIES'
+ENV_HTTP2 = 'LSBEER_HTTP2'
+ENV_RECORD = 'LSBEER_RECORD'   # dir -> every response also saved there, as a fixture
+ENV_STANDIN = 'LSBEER_STANDIN' # base url -> every request sent there instead (see bench/standin.py)
+
+CONNECT_TIMEOUT = 5 # s
+READ_TIMEOUT = 15   # s
+RETRIES = 2
+BACKOFF = 0.3       # s, doubled per retry
+RETRY_STATUSES = (500, 502, 504)
+THROTTLE_STATUSES = (429, 503) # -> rate limiter backs off, then retry
+
+POOL_CONNECTIONS = 8 # hosts kept alive, i.e. beermenus, untappd, ratebeer, beeradvocate, google, ...
+POOL_MAXSIZE = 32    # connections per host (>= engine concurrency)
+
+HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+}
+
+PARSER = 'lxml' if find_spec('lxml') else 'html.parser' # (w/o importing it yet)
+
+
+def configure(timeout=None, retries=None, http2=None):
+    """
+    set request timeout (s), number of retries, &/or HTTP/2 (requires httpx[http2]) for all sessions
+    """
+    for k, v in ((ENV_TIMEOUT, timeout), (ENV_RETRIES, retries), (ENV_HTTP2, http2)):
+        if v is not None:
+            os.environ[k] = str(int(v) if isinstance(v, bool) else v)
+
+    # rebuild w new settings
+    global _SESSION
+    with _LOCK:
+        _SESSION = None
+
+
+def get_timeout():
+    try:
+        read = float(os.environ[ENV_TIMEOUT])
+    except(KeyError, ValueError):
+        read = READ_TIMEOUT
+    return (min(CONNECT_TIMEOUT, read), read)
+
+
+def get_retries():
+    try:
+        return int(os.environ[ENV_RETRIES])
+    except(KeyError, ValueError):
+        return RETRIES
+
+
+def use_http2():
+    return os.environ.get(ENV_HTTP2, '0') not in ('', '0')
+
+
+def _make_session():
+    if use_http2():
+        try:
+            import httpx
+
+            connect, read = get_timeout()
+            return httpx.Client(
+                http2=True,
+                headers=HEADERS,
+                follow_redirects=True,
+                timeout=httpx.Timeout(read, connect=connect),
+                transport=httpx.HTTPTransport( # (so pool limits go here, not on client, which ignores them)
+                    http2=True,
+                    retries=get_retries(),
+                    limits=httpx.Limits(max_connections=POOL_CONNECTIONS * POOL_MAXSIZE,
+                                        max_keepalive_connections=POOL_MAXSIZE)))
+
+        except(ImportError): # fall back to HTTP/1.1 keep-alive
+            pass
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=get_retries(),
+                  backoff_factor=BACKOFF,
+                  status_forcelist=RETRY_STATUSES,
+                  respect_retry_after_header=False, # i.e. 429 / 503 left to fetch (& the rate limiter)
+                  allowed_methods=None) # incl POST, i.e. (idempotent) graphql queries
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                          pool_maxsize=POOL_MAXSIZE,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+_SESSION = None
+_SESSION_PID = None
+_LOCK = threading.Lock()
+
+def get_session():
+    """
+    -> keep-alive session shared by all threads of this process (pools are threadsafe)
+
+    rebuilt after fork, so Pool workers never share sockets w parent
+    """
+    global _SESSION, _SESSION_PID
+
+    pid = os.getpid()
+    if _SESSION is None or _SESSION_PID != pid:
+        with _LOCK:
+            if _SESSION is None or _SESSION_PID != pid:
+                _SESSION, _SESSION_PID = _make_session(), pid
+
+    return _SESSION
+
+
+def request_key(method, url, body=None):
+    """
+    method, full url (w query string), body -> fixture key
+    """
+    key = sha1('{} {}'.format(method.upper(), url).encode('utf-8'))
+    if body:
+        key.update(body if isinstance(body, bytes) else body.encode('utf-8'))
+    return key.hexdigest()
+
+
+def fixture_path(fixtures_dir, method, url, body=None):
+    return os.path.join(fixtures_dir, urlparse(url).hostname,
+                        '{}.json'.format(request_key(method, url, body)))
+
+
+def record(fixtures_dir, method, url, body, response):
+    """
+    request & response -> saved as fixture json
+    """
+    path = fixture_path(fixtures_dir, method, url, body)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump({'method': method.upper(), 'url': url,
+                   'body': body.decode('utf-8') if isinstance(body, bytes) else body,
+                   'status': response.status_code,
+                   'headers': {k: response.headers[k] for k in ('Content-Type', 'ETag',
+                                                                'Last-Modified')
+                               if k in response.headers},
+                   'text': response.text}, f)
+
+
+def fetch(url, params=None, method='GET', **kwargs):
+    """
+    url, params -> response, via pooled session & per-host rate limit
+
+    raises requests.HTTPError on error status (4xx / 5xx, incl still throttled once out of retries), so
+    callers never parse an error page as "not found" (& cache it)
+    """
+    import requests # (loaded w session, on first fetch)
+
+    session = get_session()
+
+    body = kwargs.get('data')
+    if isinstance(session, requests.Session): # (httpx sets timeout per client)
+        kwargs.setdefault('timeout', get_timeout())
+    elif isinstance(body, (str, bytes)): # httpx wants raw bodies as content= (data= is for forms)
+        kwargs['content'] = kwargs.pop('data')
+
+    host = urlparse(url).hostname
+
+    standin, record_dir = os.environ.get(ENV_STANDIN), os.environ.get(ENV_RECORD)
+    if standin or record_dir: # key fixtures on full original url
+        url, params = requests.Request(method, url, params=params).prepare().url, None
+    target = (url if not standin else # e.g. https://untappd.com/b/.. -> {standin}/https/untappd.com/b/..
+              '{}/{}'.format(standin.rstrip('/'), url.replace('://', '/', 1)))
+    limiter = get_limiter()
+    retries = get_retries()
+
+    for attempt in range(retries + 1):
+        with span('ratelimit:' + host):
+            limiter.acquire(host)
+
+        with span('fetch:' + host):
+            response = session.request(method, target, params=params, **kwargs)
+        count('bytes:' + host, len(response.content))
+
+        if record_dir:
+            record(record_dir, method, url, body, response)
+
+        if response.status_code not in THROTTLE_STATUSES:
+            limiter.on_success(host)
+            break
+
+        count('throttled:' + host)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        limiter.on_throttle(host, retry_after)
+
+        if attempt < retries:
+            count('retry:' + host)
+            time.sleep(backoff(attempt, retry_after))
+
+    if response.status_code >= 400: # (e.g. still throttled)
+        raise requests.HTTPError('{} for {}'.format(response.status_code, url), response=response)
+
+    return response
+
+
+def soup_me(url, params=None, from_headless=False, **kwargs):
+    """
+    url, params -> BeautifulSoup
+    """
+    if from_headless: # needs js
+        from CLIppy import soup_me as soup_me_headless
+        with span('fetch:headless'):
+            return soup_me_headless(url, from_headless=True)
+
+    return make_soup(fetch(url, params).text, **kwargs)
+
+
+def make_soup(html, **kwargs):
+    """
+    html str -> BeautifulSoup
+
+    :parse_only: SoupStrainer, or dict of its args
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    if isinstance(kwargs.get('parse_only'), dict):
+        kwargs['parse_only'] = SoupStrainer(**kwargs['parse_only'])
+
+    with span('parse:{}'.format('partial' if kwargs.get('parse_only') else 'full')):
+        return BeautifulSoup(html, PARSER, **kwargs)
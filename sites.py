@@ -0,0 +1,141 @@
+from importlib import import_module
+import os
+
+
+# ratings sites, each declared once (w what scheduling it takes) rather than spread across
+# get_beer / cache / ratelimit / scrapers / output .. so adding a site is adding a `Site` here (or in a plugin)
+
+ENV_PLUGINS = 'LSBEER_SITES' # e.g. "mysites,othersites" (modules that `register` sites of their own)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+FIELDS = ('rating', 'abv', 'style', 'where', 'description')
+
+MENU = 'beermenus'  # not a ratings site, but its menu info (style, abv, ..) ranks among theirs..
+MENU_INFO_RANK = 1  # .. i.e. 2nd most trusted
+
+
+class Site(object):
+    """
+    ratings site, & what lsbeer needs to know to schedule it
+
+    :lookup: (module, fn name) of fn(beername, beerpage=None, verbose=False) -> statsdict, imported on first use
+             (& w fields=, if site has lazy fields)
+    :batch_lookup: (module, fn name) of fn(beernames, verbose=False) -> {beername: statsdict}, if any
+                   (ditto)
+    :domain: for rate limiting (& subdomains)
+    :limits: (requests / s, burst, max requests / s) for domain
+    :concurrency: requests in flight, at most (however many threads asked for)
+    :ttl: s before cached stats go stale
+    :beerpage_url: beerpage url prefix found by resolver (i.e. web search), if lookup takes a beerpage
+    :fields: stats provided
+    :lazy_fields: those only fetched if asked for (i.e. cost extra, & so left out of cached stats otherwise)
+    :info_rank: trust in its abv / style / .., vs other sites' (lower wins)
+    """
+
+    def __init__(self, name, lookup, domain, batch_lookup=None, limits=(5, 5, 20),
+                 concurrency=4, ttl=DAY, beerpage_url=None, fields=FIELDS, lazy_fields=(),
+                 info_rank=None):
+        self.name = name
+        self.lookup = lookup
+        self.batch_lookup = batch_lookup
+        self.domain = domain
+        self.limits = limits
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.beerpage_url = beerpage_url
+        self.fields = tuple(fields)
+        self.lazy_fields = tuple(lazy_fields)
+        self.info_rank = info_rank
+
+    @property
+    def needs_resolver(self):
+        return self.beerpage_url is not None
+
+    def __repr__(self):
+        return 'Site({!r})'.format(self.name)
+
+
+REGISTRY = {} # name -> Site, in column order
+
+
+def register(site):
+    """
+    site -> site, added to registry (so must happen as sites.py is imported, i.e. in a plugin)
+    """
+    if site.info_rank is None:
+        site.info_rank = MENU_INFO_RANK + len(REGISTRY) + 1
+    REGISTRY[site.name] = site
+    return site
+
+
+register(Site('untappd',
+              lookup=('scrapers', 'get_reviews_untappd'),
+              domain='untappd.com',
+              limits=(1, 2, 4), # blocks IPs
+              ttl=(3 * DAY),
+              beerpage_url='https://untappd.com/b/',
+              fields=('rating', 'abv', 'style', 'description'),
+              info_rank=0))
+
+register(Site('ratebeer',
+              lookup=('scrapers', 'get_reviews_ratebeer'),
+              batch_lookup=('scrapers', 'get_reviews_ratebeer_en_masse'),
+              domain='ratebeer.com',
+              limits=(4, 4, 10),
+              concurrency=8, # api, not pages
+              ttl=(7 * DAY),
+              fields=('rating', 'abv', 'description'),
+              lazy_fields=('description',))) # (searches by name, so no beerpage)
+
+register(Site('beeradvocate',
+              lookup=('scrapers', 'get_reviews_beeradvocate'),
+              domain='beeradvocate.com',
+              limits=(2, 4, 8),
+              ttl=(7 * DAY),
+              beerpage_url='https://www.beeradvocate.com/beer/',
+              fields=('rating', 'abv', 'style', 'where')))
+
+for plugin in filter(None, os.environ.get(ENV_PLUGINS, '').split(',')):
+    import_module(plugin.strip())
+
+
+SITES = tuple(REGISTRY.keys())
+
+# where abv / style / .. come from, most trusted first
+INFO_RANKING = tuple(sorted(SITES + (MENU,), key=lambda k: (
+    REGISTRY[k].info_rank if k in REGISTRY else MENU_INFO_RANK)))
+
+
+def resolved(sites=SITES):
+    """
+    -> those of sites that take a beerpage from the resolver (& so wait on it)
+    """
+    return tuple(site for site in sites if REGISTRY[site].needs_resolver)
+
+
+def batched(sites=SITES):
+    """
+    -> those of sites w batch lookup
+    """
+    return tuple(site for site in sites if REGISTRY[site].batch_lookup is not None)
+
+
+def needs(fields, sites=SITES):
+    """
+    fields wanted (e.g. by an output) -> {site: those of fields it provides}, for sites w any (i.e. the rest
+                                         needn't be looked up at all)
+    """
+    d_fields = {site: tuple(k for k in fields if k in REGISTRY[site].fields) for site in sites}
+    return {site: fields_ for site, fields_ in d_fields.items() if fields_}
+
+
+def covers(stats, site, fields):
+    """
+    cached statsdict (or None) -> has all fields site would be asked for ? (i.e. not cached before any lazy
+                                  ones were wanted)
+    """
+    if stats is None:
+        return False
+    return not stats or all(k in stats for k in REGISTRY[site].lazy_fields if k in fields) # ({} = not found)
@@ -0,0 +1,123 @@
+import os
+import sys
+
+from cache import CACHE_PATH, SqliteStore
+from get_beer import iter_beer_dict, print_fancy, print_simple
+from names import canonicalize
+from output import SITE_FIELDS, TEXT_FIELDS, format_key, is_pending
+from sites import SITES
+
+
+# --stream: beerfiles too big to hold (e.g. catalog exports), looked up & written as they're read
+
+WINDOW = 8    # beers in flight per concurrent request per site, i.e. WINDOW x nthreads in all
+MAXWIDTH = 36 # beername column, since names aren't all known up front
+
+
+class Checkpoint(SqliteStore):
+    """
+    beers seen & done per beerfile, so dedup needn't grow memory & an interrupted run can resume
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS checkpoint ('
+        'source TEXT NOT NULL, '
+        'name TEXT NOT NULL, '
+        'done INTEGER NOT NULL DEFAULT 0, '
+        'PRIMARY KEY (source, name))',
+    )
+
+    def claim(self, source, name):
+        """
+        -> True if name new to source (& now claimed), else False (i.e. dupe, or done last run)
+        """
+        cursor = self.conn.execute('INSERT OR IGNORE INTO checkpoint (source, name) VALUES (?, ?)',
+                                   (source, name))
+        return cursor.rowcount == 1
+
+    def mark(self, source, name):
+        self.conn.execute('UPDATE checkpoint SET done = 1 WHERE source = ? AND name = ?',
+                          (source, name))
+
+    def n_done(self, source):
+        n, = self.conn.execute('SELECT COUNT(*) FROM checkpoint WHERE source = ? AND done',
+                               (source,)).fetchone()
+        return n
+
+    def reset(self, source, resume=False):
+        """
+        forget source's beers (or, if resuming, just those claimed but never done)
+        """
+        self.conn.execute('DELETE FROM checkpoint WHERE source = ?{}'.format(
+            ' AND NOT done' if resume else ''), (source,))
+
+
+def iter_new_beers(path, checkpoint, source):
+    """
+    path/to/beerfile -> iterator of beers (1 per line), read lazily, w/o dupes (incl near-duplicate spellings)
+                        or any done last run
+    """
+    with open(path) as f:
+        for line in f:
+            beer = line.strip()
+            if beer and checkpoint.claim(source, canonicalize(beer)):
+                yield beer
+
+
+def stream_main(beerfile, resume=False, writer=None, fancy=False, filter_by=[],
+                min_rating=None, min_abv=None, nthreads=4, verbose=False, refresh=False,
+                offline=False, deadline=None, site_timeout=None, hedge=False, **kwargs):
+    """
+    beerfile -> None, w each beer written (as row, or line) as it lands
+
+    memory stays flat however big the file: beers are read lazily, deduped in the checkpoint db (not in
+    memory) & at most WINDOW x nthreads are in flight at once
+
+    :resume: skip beers done by last (interrupted) run of this beerfile
+    """
+    from tqdm import tqdm
+
+    from ranking import is_kept
+
+    SPACER = '  '
+    SEP = '|'
+
+    source = os.path.abspath(beerfile)
+    barname = beerfile.split('_')[-1]
+
+    checkpoint = Checkpoint(CACHE_PATH)
+    checkpoint.reset(source, resume=resume)
+
+    n_done = checkpoint.n_done(source)
+    print('\n what\'s on @ {} ?? {}\n'.format(barname.upper(), '(resuming after {} beers)'.format(
+        n_done) if n_done else ''))
+
+    results = iter_beer_dict(iter_new_beers(beerfile, checkpoint, source), nthreads=nthreads,
+                             verbose=verbose, refresh=refresh, offline=offline,
+                             deadline=deadline, hedge=hedge,
+                             fields=(SITE_FIELDS if writer is not None else TEXT_FIELDS),
+                             site_timeouts=dict.fromkeys(SITES, site_timeout),
+                             window=(WINDOW * nthreads))
+    pprint = print_fancy if fancy else print_simple
+
+    try:
+        for beer, d_stats in results: # as they land
+            if is_kept(d_stats, filter_by=filter_by, min_rating=min_rating, min_abv=min_abv):
+
+                if writer is not None:
+                    writer.write(barname, beer, d_stats)
+                else:
+                    with tqdm.external_write_mode(): # print above progress bar
+                        pprint(beer, d_stats, maxwidth=MAXWIDTH, maxstylewidth=0, sep=SEP,
+                               spacer=SPACER)
+                    sys.stdout.flush()
+
+            if not is_pending(d_stats): # (once written, & only if complete, so --resume retries the rest)
+                checkpoint.mark(source, canonicalize(beer))
+
+    except(KeyboardInterrupt):
+        print('\ninterrupted after {} beers (rerun w --resume to pick up from there)\n'.format(
+            checkpoint.n_done(source)), file=sys.stderr)
+        sys.exit(130)
+
+    if not fancy and writer is None:
+        print('\n{}\n'.format(format_key(SITES, sep=SEP, spacer=SPACER)))